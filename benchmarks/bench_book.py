@@ -0,0 +1,79 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Puzzle book benchmarks: load time, memory and random access cost for the
+#  binary and the gzipped JSON books.
+
+import sys
+import json
+import random
+import subprocess
+import common
+from puzzle_book import PuzzleBook
+
+BOOKS = ("puzzles.bin", "puzzles.json.gz")
+
+# Loads a book in a fresh interpreter and reports the time and peak RSS growth
+# (ru_maxrss, KiB on Linux). tracemalloc would miss the memory-mapped pages
+# and slows JSON parsing down too much to be useful.
+_LOAD_SCRIPT = """
+import sys, json, time, resource
+sys.path.insert(0, sys.argv[1])
+from puzzle_book import PuzzleBook
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+book = PuzzleBook(sys.argv[2])
+seconds = time.perf_counter() - start
+book[len(book) - 1]
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"puzzles": len(book), "first_load_s": seconds, "rss_growth_kib": after - before}))
+"""
+
+def bench_load(file_name: str, repeat: int) -> dict:
+    """Times opening a book, cold in a new process and then repeatedly in this one."""
+    out = subprocess.run([sys.executable, "-c", _LOAD_SCRIPT, common.GAME_DIR, file_name],
+                         capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout)
+
+    def load():
+        PuzzleBook(file_name).close()
+    result["load"] = common.measure(load, repeat, warmup=0)
+    return result
+
+def bench_access(file_name: str, repeat: int) -> dict:
+    """Times uncached random puzzle lookups."""
+    book = PuzzleBook(file_name, cache_size=0)
+    rng = random.Random(0)
+    nums = [rng.randrange(len(book)) for _ in range(repeat)]
+    it = iter(nums)
+    result = common.measure(lambda: book[next(it)], repeat - 1)
+    book.close()
+    return result
+
+def run(quick: bool = False) -> dict:
+    results = {}
+    for file_name in BOOKS:
+        load_repeat = 1 if file_name.endswith(".gz") else (5 if quick else 50)
+        results[file_name] = bench_load(file_name, load_repeat)
+        results[file_name]["random_access"] = bench_access(file_name, 1000 if quick else 20000)
+    return results
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,141 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Game core benchmarks, run against a headless DungeonCross: opening puzzles
+#  in every orientation, the per-click logic (mouse event -> board update ->
+#  hint update -> win check), opening the menu from the book icon and drawing.
+
+import random
+import pygame
+import common
+import bitboard
+
+def cell_pos(x: int, y: int) -> tuple:
+    """Pixel position inside grid cell (x, y)."""
+    import dungeon_cross
+    return ((x + 1) * dungeon_cross.TILE_SIZE + 5, (y + 1) * dungeon_cross.TILE_SIZE + 5)
+
+def click(game, x: int, y: int, button: int = 1):
+    game._mouse_button_down(cell_pos(x, y), button)
+    game._mouse_button_up(button)
+
+def bench_open_puzzle(game, count: int) -> dict:
+    """Times open_puzzle for the same puzzles in each of the 8 orientations."""
+    rng = random.Random(0)
+    nums = [rng.randrange(game.number_of_puzzles) for _ in range(count)]
+    results = {}
+    for t in range(8):
+        flip, rot = divmod(t, 4)
+        ids = iter([int(f"{flip}{rot}{num:05d}") for num in nums])
+        results[f"flip{flip}_rot{rot}"] = common.measure(lambda: game.open_puzzle(next(ids)), count - 1)
+    return results
+
+def bench_clicks(game, count: int) -> dict:
+    """
+    Times single clicks on a board: placing and removing walls (hint update and,
+    once all hints are met, the rule check), placing marks, and the final click
+    that wins a puzzle.
+    """
+
+    rng = random.Random(1)
+    nums = [rng.randrange(game.number_of_puzzles) for _ in range(count)]
+    wall_clicks = []
+    mark_clicks = []
+    win_clicks = []
+    for num in nums:
+        game.open_puzzle(num)
+        board = game._board_layout
+        walls = list(bitboard.iter_cells(board.walls))
+        free = list(bitboard.iter_cells(bitboard.FULL_MASK ^ board.walls ^ board.enemies ^ board.chests))
+        wall_clicks.append(walls[0])
+        if free:
+            mark_clicks.append(free[0])
+        win_clicks.append(walls)
+
+    def run_clicks(cells, button):
+        it = iter(cells)
+        def one():
+            x, y = next(it)
+            click(game, x, y, button)       # place
+            click(game, x, y, button)       # and remove again
+        return one
+
+    results = {}
+    game.open_puzzle(nums[0])
+    results["wall_place_remove"] = common.measure(run_clicks([wall_clicks[0]] * count, 1), count - 1)
+    results["mark_place_remove"] = common.measure(run_clicks([mark_clicks[0]] * count, 3), count - 1)
+
+    # time only the last click of each solve, the one that runs the rule check
+    samples = []
+    for num, walls in zip(nums, win_clicks):
+        game.open_puzzle(num)
+        for x, y in walls[:-1]:
+            click(game, x, y)
+        _, seconds = common.time_once(lambda: click(game, *walls[-1]))
+        if not game.game_won:
+            raise RuntimeError(f"Solving puzzle {num} didn't win")
+        samples.append(int(seconds * 1e9))
+    results["winning_click"] = common.summarize(samples)
+    return results
+
+def bench_menu_icon(game, count: int) -> dict:
+    """
+    Times a click on the menu book icon followed by closing the menu again,
+    the way input_replay.replay does. The menu itself is never drawn, so it's
+    never built.
+    """
+
+    pos = (5, 5)
+    def one():
+        game.handle_io_event(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+        game.handle_io_event(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1))
+        if not game._menu_is_open:
+            raise RuntimeError("Clicking the book icon didn't open the menu")
+        game._menu_close()
+    return {"icon_click_and_close": common.measure(one, count)}
+
+def bench_draw(game, count: int) -> dict:
+    """Times a full redraw and a single-cell dirty redraw."""
+    game.open_puzzle(45)
+    walls = list(bitboard.iter_cells(game._board_layout.walls))
+    for x, y in walls[::2]:
+        click(game, x, y)
+    results = {"draw_game": common.measure(game._draw_game, count)}
+    x, y = walls[1]
+    def dirty():
+        click(game, x, y)
+        game._draw_dirty()
+    results["click_and_draw_dirty"] = common.measure(dirty, count)
+    game.pop_update_rects()
+    return results
+
+def run(quick: bool = False) -> dict:
+    game = common.make_game()
+    count = 100 if quick else 1000
+    return {
+        "open_puzzle": bench_open_puzzle(game, count),
+        "clicks": bench_clicks(game, count),
+        "menu": bench_menu_icon(game, count),
+        "draw": bench_draw(game, count),
+    }
+
+
+if __name__ == '__main__':
+    import json
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,61 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  map_convert benchmarks: throughput of building maps from mapcodes.txt and
+#  of packing, canonicalizing and writing them as a puzzle book.
+
+import os
+import tempfile
+import common
+import map_convert
+
+def run(quick: bool = False) -> dict:
+    with open("mapcodes.txt", 'r') as f:
+        lines = f.read().splitlines()
+    if quick:
+        lines = lines[:map_convert.SHARD_SIZE]
+    count = len(lines)
+    results = {"maps": count}
+
+    def rate(seconds: float) -> dict:
+        return {"seconds": seconds, "maps_per_s": count / seconds}
+
+    maps, seconds = common.time_once(lambda: map_convert.convert_maps_batch(lines))
+    results["build"] = rate(seconds)
+    _, seconds = common.time_once(lambda: list(map_convert.iter_built_maps(lines)))
+    results["build_sharded"] = rate(seconds)
+    _, seconds = common.time_once(lambda: map_convert.pack_maps(maps))
+    results["pack"] = rate(seconds)
+    _, seconds = common.time_once(lambda: map_convert.canonicalize_maps(maps))
+    results["canonicalize"] = rate(seconds)
+
+    fd, out_file = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    try:
+        _, seconds = common.time_once(
+            lambda: map_convert.write_bin_book(out_file, map_convert.iter_built_maps(lines)))
+        results["build_and_write_bin"] = rate(seconds)
+    finally:
+        os.remove(out_file)
+    return results
+
+
+if __name__ == '__main__':
+    import json
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,90 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Shared setup for the benchmarks. Importing this module points SDL at its
+#  dummy video/audio drivers and puts the game directory on sys.path, so the
+#  benchmarks run headless from any working directory.
+
+import os
+import sys
+import subprocess
+from time import perf_counter_ns
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+GAME_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if GAME_DIR not in sys.path:
+    sys.path.insert(0, GAME_DIR)
+os.chdir(GAME_DIR)      # resource_path() looks up assets from the working directory
+
+import profiler
+
+
+def summarize(samples_ns: list) -> dict:
+    """Returns timing stats for a list of nanosecond samples, in microseconds (see profiler.Profiler.stats)."""
+    prof = profiler.Profiler(window=len(samples_ns))
+    prof.enabled = True
+    for ns in samples_ns:
+        prof.record("t", ns)
+    return prof.stats()["t"]
+
+def measure(func, repeat: int, warmup: int = 1) -> dict:
+    """Calls func warmup + repeat times and returns the timing stats of the repeated calls."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        func()
+        samples.append(perf_counter_ns() - start)
+    return summarize(samples)
+
+def time_once(func) -> tuple:
+    """Calls func once. Returns (result, elapsed seconds)."""
+    start = perf_counter_ns()
+    ret = func()
+    return ret, (perf_counter_ns() - start) / 1e9
+
+def git_commit() -> str:
+    """Returns the short hash of the checked out commit, or "unknown"."""
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=GAME_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def make_game(book: str = "puzzles.bin"):
+    """
+    Creates a headless game with sound effects turned off and loads a puzzle
+    book. Returns the DungeonCross object.
+    """
+
+    import dungeon_cross
+    import pygame
+    import sound_handler
+    pygame.init()
+    screen = pygame.display.set_mode(dungeon_cross.G_RESOLUTION)
+    sound = sound_handler.SoundHandler(dungeon_cross.resource_path('audio/music/'))
+    game = dungeon_cross.DungeonCross(screen, sound)
+    sound.enabled = False
+    game.load_puzzle_book(book)
+    return game
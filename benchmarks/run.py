@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Runs the benchmark suite headless and writes the results as JSON. Pass an
+#  earlier results file with --compare to see how each number changed.
+#
+#    python3 benchmarks/run.py -o before.json
+#    (change things)
+#    python3 benchmarks/run.py -o after.json --compare before.json
+
+import sys
+import json
+import time
+import argparse
+import platform
+import common
+
+SUITES = ("book", "game", "map_convert")
+
+def run_suite(name: str, quick: bool) -> dict:
+    module = __import__(f"bench_{name}")
+    return module.run(quick)
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    """Flattens nested results to {"a.b.c": number}."""
+    out = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+def compare(old: dict, new: dict) -> None:
+    """Prints the old and new value of every shared result, with the ratio new / old."""
+    old_flat = flatten(old["results"])
+    new_flat = flatten(new["results"])
+    print(f"Comparing {old['meta']['commit']} -> {new['meta']['commit']}")
+    width = max((len(k) for k in new_flat), default=0)
+    for key, value in new_flat.items():
+        if key not in old_flat or key.endswith(".count"):
+            continue
+        base = old_flat[key]
+        ratio = f"{value / base:7.2f}x" if base else "      -"
+        print(f"{key:<{width}}  {base:14.3f}  {value:14.3f}  {ratio}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Dungeon Cross benchmarks")
+    parser.add_argument("-o", "--output", help="Write results to this JSON file (default: print them).")
+    parser.add_argument("-q", "--quick", action="store_true", help="Fewer iterations and a smaller map_convert corpus.")
+    parser.add_argument("-s", "--suite", action="append", choices=SUITES, help="Only run this suite. Can be repeated.")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    import numpy
+    import pygame
+    results = {
+        "meta": {
+            "commit": common.git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": args.quick,
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": numpy.__version__,
+            "platform": platform.platform(),
+        },
+        "results": {},
+    }
+    for name in args.suite or SUITES:
+        print(f"Running {name}...", file=sys.stderr, flush=True)
+        results["results"][name] = run_suite(name, args.quick)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  An 8x8 board fits in a single 64-bit integer. The bit layout matches the
+#  codes in mapcodes.txt: row 0 is the most significant byte and column x
+#  is bit x of its row byte, so bit (7 - y) * 8 + x holds cell (x, y).
+
+from map_object_enum import MapObject
+
+FULL_MASK = (1 << 64) - 1
+COLUMN_MASKS = tuple(0x0101010101010101 << x for x in range(8))
+ROW_MASKS = tuple(0xFF << ((7 - y) * 8) for y in range(8))
+
+try:
+    popcount = int.bit_count
+except AttributeError:      # Python < 3.10
+    def popcount(value: int) -> int:
+        return bin(value).count('1')
+
+
+def _transform_cell(x: int, y: int, flip: bool, rot: int) -> tuple:
+    """
+    Returns where cell (x, y) ends up after rotating the board rot times by 90
+    degrees counter-clockwise (same as numpy.rot90), then mirroring it left to
+    right if flip is set.
+    """
+
+    for _ in range(rot):
+        x, y = y, 7 - x
+    if flip:
+        x = 7 - x
+    return x, y
+
+def _build_transform_tables() -> tuple:
+    """
+    Builds the lookup tables used by transform(). For each of the 8 symmetries
+    and each row there is a 256 entry table mapping that row's byte to its
+    bits in the transformed mask, so a transform is 8 lookups.
+    """
+
+    tables = []
+    for t in range(8):
+        flip, rot = divmod(t, 4)
+        rows = []
+        for y in range(8):
+            table = [0] * 256
+            for x in range(8):
+                tx, ty = _transform_cell(x, y, bool(flip), rot)
+                table[1 << x] = cell_bit(tx, ty)
+            for b in range(3, 256):
+                low = b & -b
+                if b != low:
+                    table[b] = table[b ^ low] | table[low]
+            rows.append(table)
+        tables.append(tuple(rows))
+    return tuple(tables)
+
+def _build_compose_table() -> tuple:
+    """
+    Builds the table used by compose(). Each symmetry is written out as the
+    cell permutation it applies, so two of them can be chained and matched
+    back to a symmetry number.
+    """
+
+    cells = [(x, y) for y in range(8) for x in range(8)]
+    perms = [tuple(_transform_cell(x, y, bool(t // 4), t % 4) for x, y in cells) for t in range(8)]
+    lookup = {perm: t for t, perm in enumerate(perms)}
+    table = []
+    for a in range(8):
+        flip, rot = bool(a // 4), a % 4
+        table.append(tuple(lookup[tuple(_transform_cell(x, y, flip, rot) for x, y in perms[b])] for b in range(8)))
+    return tuple(table)
+
+def transform_index(flip: bool, rot: int) -> int:
+    """Returns the symmetry number (0 - 7) used by transform()."""
+    return (4 if flip else 0) + rot % 4
+
+def transform(mask: int, t: int) -> int:
+    """Applies symmetry t (see transform_index) to a mask."""
+    if t == 0:
+        return mask
+    tables = _TRANSFORM_TABLES[t]
+    out = 0
+    for y in range(8):
+        out |= tables[y][(mask >> ((7 - y) * 8)) & 0xFF]
+    return out
+
+def transform_masks(masks, t: int):
+    """
+    Applies symmetry t to every mask in a NumPy u64 array, with the same
+    lookup tables as transform(). Returns a new array.
+    """
+
+    import numpy
+    global _TRANSFORM_ARRAYS
+    if _TRANSFORM_ARRAYS is None:
+        _TRANSFORM_ARRAYS = numpy.array(_TRANSFORM_TABLES, dtype=numpy.uint64)
+    rows = numpy.ascontiguousarray(masks, dtype='<u8').view(numpy.uint8).reshape(-1, 8)
+    out = numpy.zeros(len(rows), dtype=numpy.uint64)
+    for y, table in enumerate(_TRANSFORM_ARRAYS[t]):
+        out |= table.take(rows[:, 7 - y])
+    return out
+
+def compose(a: int, b: int) -> int:
+    """Returns the symmetry that applies symmetry b, then symmetry a."""
+    return _COMPOSE_TABLE[a][b]
+
+def inverse(t: int) -> int:
+    """Returns the symmetry that undoes symmetry t."""
+    return _INVERSE[t]
+
+def canonical_transform(walls: int, enemies: int, chests: int) -> tuple:
+    """
+    Finds the canonical form of a puzzle: whichever of its 8 symmetries has
+    the smallest (walls, enemies, chests) masks, same as map_convert.py.
+    Returns (t, canonical masks, stabilizer), where t is the symmetry that
+    turns the puzzle into its canonical form and bit g of stabilizer is set
+    if symmetry g leaves the canonical form unchanged.
+    """
+
+    # the walls alone almost always decide it, only ties need the other masks
+    keys = [transform(walls, t) for t in range(8)]
+    best = min(keys)
+    ties = [t for t in range(8) if keys[t] == best]
+    if len(ties) > 1:
+        full = {t: (best, transform(enemies, t), transform(chests, t)) for t in ties}
+        best_key = min(full.values())
+        ties = [t for t in ties if full[t] == best_key]
+    else:
+        best_key = (best, transform(enemies, ties[0]), transform(chests, ties[0]))
+    t = ties[0]
+    undo = inverse(t)
+    stabilizer = 0
+    for u in ties:
+        stabilizer |= 1 << compose(u, undo)
+    return t, best_key, stabilizer
+
+def cell_bit(x: int, y: int) -> int:
+    """Returns the mask bit for grid position (x, y)."""
+    return 1 << ((7 - y) * 8 + x)
+
+def row_count(mask: int, y: int) -> int:
+    """Returns the number of set cells in row y."""
+    return popcount(mask & ROW_MASKS[y])
+
+def column_count(mask: int, x: int) -> int:
+    """Returns the number of set cells in column x."""
+    return popcount(mask & COLUMN_MASKS[x])
+
+def iter_cells(mask: int):
+    """Yields the (x, y) grid position of every set cell in mask."""
+    while mask:
+        low = mask & -mask
+        i = low.bit_length() - 1
+        yield i & 7, 7 - (i >> 3)
+        mask ^= low
+
+
+_TRANSFORM_TABLES = _build_transform_tables()
+_COMPOSE_TABLE = _build_compose_table()
+_INVERSE = tuple(row.index(0) for row in _COMPOSE_TABLE)
+
+# NumPy copy of _TRANSFORM_TABLES, made by the first transform_masks() call
+_TRANSFORM_ARRAYS = None
+
+
+class Bitboard:
+    """
+    8x8 board stored as one mask per map object. Used both for the puzzle
+    answer (walls, enemies, chests) and the user's board (placed walls and marks
+    on top of the puzzle's enemies and chests).
+    """
+
+    __slots__ = ("walls", "marks", "enemies", "chests")
+
+    def __init__(self, walls: int = 0, marks: int = 0, enemies: int = 0, chests: int = 0):
+        self.walls = walls
+        self.marks = marks
+        self.enemies = enemies
+        self.chests = chests
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Bitboard):
+            return NotImplemented
+        return (self.walls, self.marks, self.enemies, self.chests) == \
+               (other.walls, other.marks, other.enemies, other.chests)
+
+    def __repr__(self) -> str:
+        return f"Bitboard(walls={self.walls:#018x}, marks={self.marks:#018x}, " \
+               f"enemies={self.enemies:#018x}, chests={self.chests:#018x})"
+
+    @classmethod
+    def from_grid(cls, grid: list) -> "Bitboard":
+        """Builds a board from an 8x8 list of MapObject values."""
+        board = cls()
+        for y, row in enumerate(grid):
+            for x, obj in enumerate(row):
+                board.set(x, y, obj)
+        return board
+
+    def to_grid(self) -> list:
+        """Returns the board as an 8x8 list of MapObject values."""
+        return [[self.get(x, y) for x in range(8)] for y in range(8)]
+
+    def copy(self) -> "Bitboard":
+        return Bitboard(self.walls, self.marks, self.enemies, self.chests)
+
+    def transformed(self, t: int) -> "Bitboard":
+        """Returns a copy of the board with symmetry t (see transform_index) applied."""
+        return Bitboard(transform(self.walls, t), transform(self.marks, t),
+                        transform(self.enemies, t), transform(self.chests, t))
+
+    def get(self, x: int, y: int) -> int:
+        """Returns the MapObject value at grid position (x, y)."""
+        bit = cell_bit(x, y)
+        if self.walls & bit:
+            return MapObject.WALL.value
+        if self.marks & bit:
+            return MapObject.MARK.value
+        if self.enemies & bit:
+            return MapObject.ENEMY.value
+        if self.chests & bit:
+            return MapObject.CHEST.value
+        return MapObject.EMPTY.value
+
+    def set(self, x: int, y: int, obj: int) -> None:
+        """Sets grid position (x, y) to a MapObject value, clearing whatever was there."""
+        bit = cell_bit(x, y)
+        keep = FULL_MASK ^ bit
+        self.walls &= keep
+        self.marks &= keep
+        self.enemies &= keep
+        self.chests &= keep
+        if obj == MapObject.WALL.value:
+            self.walls |= bit
+        elif obj == MapObject.MARK.value:
+            self.marks |= bit
+        elif obj == MapObject.ENEMY.value:
+            self.enemies |= bit
+        elif obj == MapObject.CHEST.value:
+            self.chests |= bit
+
+    def row_count(self, y: int) -> int:
+        """Returns the number of walls in row y."""
+        return row_count(self.walls, y)
+
+    def column_count(self, x: int) -> int:
+        """Returns the number of walls in column x."""
+        return column_count(self.walls, x)
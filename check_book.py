@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+#     DC Puzzle Book Checker
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import solver
+from bitboard import popcount
+from puzzle_book import PuzzleBook, PuzzleBookWriter
+from puzzle_index import build_book_index, index_path, write_index
+
+VERSION = "v1.1.0"
+CHUNK_SIZE = 500
+
+def difficulty_score(walls: int, enemies: int, chests: int, stats: dict) -> int:
+    """
+    Rates how hard a puzzle is from the solver's effort. Mostly how often the
+    search had to branch, plus a point for each wall to place and two for each
+    clue (enemy or chest) short of twelve.
+    """
+
+    clues = popcount(enemies) + popcount(chests)
+    score = 8 * stats["branches"] + popcount(walls) + 2 * max(0, 12 - clues)
+    return min(score, 0xFFFF)
+
+def check_range(task: tuple) -> list:
+    """
+    Worker entry point. Checks puzzles first to last - 1 of a book. Returns a
+    (puzzle number, solution count, answer valid, difficulty) tuple for each. 
+    Solutions are only counted up to 2, that's enough to know a puzzle isn't unique.
+    """
+
+    file_name, first, last = task
+    book = PuzzleBook(file_name, cache_size=0)
+    results = []
+    for num in range(first, last):
+        p = book[num]
+        valid = solver.check_walls(p.walls, p.enemies, p.chests)
+        stats = {}
+        count = solver.count_solutions(*solver.hints_from_walls(p.walls), p.enemies, p.chests, limit=2, stats=stats)
+        results.append((num, count, valid, difficulty_score(*p, stats)))
+    book.close()
+    return results
+
+def check_book(file_name: str, count: int, jobs: int = 1):
+    """Checks every puzzle in a book, yielding the results of each chunk as it finishes."""
+    tasks = [(file_name, i, min(i + CHUNK_SIZE, count)) for i in range(0, count, CHUNK_SIZE)]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(check_range, tasks)
+    else:
+        yield from map(check_range, tasks)
+
+def write_book(book: PuzzleBook, file_name: str, nums: list, scores: list) -> int:
+    """
+    Writes puzzles nums of a book, with their difficulty scores, to file_name
+    plus ".tmp". It's moved over file_name once the book being read is closed,
+    so the output may replace it. Returns the number of puzzles written.
+    """
+
+    with PuzzleBookWriter(file_name + ".tmp") as writer:
+        for num in nums:
+            writer.write_puzzle(book[num])
+        writer.set_difficulty([scores[num] for num in nums])
+    return writer.count
+
+def main():
+    print(f"Puzzle Book Checker {VERSION}")
+
+    parser = argparse.ArgumentParser(description="Checks that every puzzle in a book has one valid solution.")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("-r", "--report", default="puzzle_report.csv", help="Report file, lists every puzzle that failed.")
+    parser.add_argument("-o", "--output", help="Also write a book holding only the puzzles that passed. Note this renumbers the puzzles.")
+    parser.add_argument("-d", "--difficulty", help="Also write a copy of the whole book with a difficulty index. May be the book being checked.")
+    parser.add_argument("file", nargs='?', default="puzzles.bin")
+    args = parser.parse_args()
+
+    book = PuzzleBook(args.file)
+    total = len(book)
+    print(f"Checking {total} puzzles from {args.file} with {args.jobs} jobs.")
+
+    failed = []
+    scores = [0] * total
+    done = 0
+    start = time.perf_counter()
+    for results in check_book(args.file, total, args.jobs):
+        failed += [r for r in results if r[1] != 1 or not r[2]]
+        for r in results:
+            scores[r[0]] = r[3]
+        done += len(results)
+        elapsed = time.perf_counter() - start
+        print(f"\r{done}/{total} puzzles, {done / elapsed:.0f} puzzles/s, {len(failed)} failed", end='', flush=True)
+    print(f"\nDone in {time.perf_counter() - start:.1f}s.")
+
+    # report
+    with open(args.report, 'w') as f:
+        f.write("puzzle,solutions,answer_valid\n")
+        for num, count, valid, _ in failed:
+            f.write(f"{num},{count if count < 2 else '2+'},{int(valid)}\n")
+    print(f"Unique:       {total - len(failed)}")
+    print(f"Not unique:   {sum(1 for r in failed if r[1] > 1)}")
+    print(f"No solution:  {sum(1 for r in failed if r[1] == 0)}")
+    print(f"Bad answer:   {sum(1 for r in failed if not r[2])}")
+    print(f"Report written to {args.report}.")
+
+    ranked = sorted(scores)
+    print(f"Difficulty:   min {ranked[0]}, median {ranked[total // 2]}, max {ranked[-1]}")
+
+    # filtered book
+    outputs = []
+    if args.output:
+        skip = {r[0] for r in failed}
+        count = write_book(book, args.output, [num for num in range(total) if num not in skip], scores)
+        outputs.append(args.output)
+        print(f"Wrote {count} puzzles to {args.output}.")
+
+    # whole book with a difficulty index
+    if args.difficulty:
+        count = write_book(book, args.difficulty, list(range(total)), scores)
+        outputs.append(args.difficulty)
+        print(f"Wrote {count} puzzles with a difficulty index to {args.difficulty}.")
+    book.close()
+    for file_name in outputs:
+        os.replace(file_name + ".tmp", file_name)
+
+        # a feature index built from the old contents would otherwise be kept
+        if os.path.exists(index_path(file_name)):
+            write_index(index_path(file_name), build_book_index(file_name))
+            print(f"Rewrote feature index {index_path(file_name)}.")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
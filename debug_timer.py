@@ -1,13 +1,17 @@
 import logging
+import functools
+from time import perf_counter_ns
 from typing import Callable
+from profiler import PROFILER
 
 def debug_timer(func: Callable) -> Callable:
-    """Debug timer decorator. Outputs to log file."""
-    def timer(*args):
-        from time import time
-        init_time = time()
-        ret = func(*args)
-        total_time = time() - init_time
-        logging.debug(f"TIMER: {func.__name__} : {total_time}")
+    """Debug timer decorator. Outputs to log file and records to the profiler when it's enabled."""
+    @functools.wraps(func)
+    def timer(*args, **kwargs):
+        init_time = perf_counter_ns()
+        ret = func(*args, **kwargs)
+        total_time = perf_counter_ns() - init_time
+        logging.debug(f"TIMER: {func.__name__} : {total_time / 1e9:.6f}")
+        PROFILER.record(func.__name__, total_time)
         return ret
-    return timer
\ No newline at end of file
+    return timer
@@ -19,27 +19,35 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA 02110-1301, USA.
 
-from copy import deepcopy
+import sys
+import startup_profile
+
+# must be set up before anything else is imported to time the imports
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    startup_profile.install()
+
 import math
-import gzip
-import json
 import time
-import numpy
+import argparse
 import pygame
 import random
 import logging
-import hashlib
-import pygame_menu
-import pygame_menu.locals
-import pygame_menu.events
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-# local includes
+# local includes. pygame_menu, solver, puzzle_index, progress_store and input_replay are imported
+# where they're first needed, they aren't used until after the game has started
 import log_system
+import bitboard
+import puzzle_book
 import sound_handler
+import profiler
+from bitboard import Bitboard
+from play_history import PlayHistory
 from map_object_enum import MapObject
 from resource_path import resource_path
-from save_game import SaveFile
+from save_game import SaveFile, get_save_path
+from sprite_atlas import SpriteAtlas, decode_sprites
 from debug_timer import debug_timer
 from mouse_action_enum import MouseAction
 
@@ -48,8 +56,15 @@ G_LOG_LEVEL = logging.INFO
 TILE_SIZE = 90
 G_RESOLUTION = (TILE_SIZE * 9, TILE_SIZE * 9)
 TARGET_FPS = 60
+POWER_SAVE_FPS = 30
+IDLE_TIMEOUT_MS = 1000
+RANDOM_PUZZLE_TRIES = 32
 THEME_COLOR = (100, 70, 0)
 
+# Random puzzle difficulty settings. Anything past "Any" is a band of the
+# puzzle book's difficulty index, easiest first.
+DIFFICULTY_NAMES = ("Any", "Easy", "Medium", "Hard", "Expert")
+
 # Used to store a single user action for undo/redo functions
 HistoryAction = namedtuple("HistoryAction", ['x', 'y', 'old_state', 'new_state'])
 
@@ -61,11 +76,7 @@ class DungeonCross:
         self._sound: sound_handler.SoundHandler = sound
         self._save_file = SaveFile("dungeon_cross.sav")
 
-        # Create Menus 
-        self._menu_theme = self._menu_build_theme()
-        self._menu_tutorial = self._menu_build_tutorial()
-        self._menu_about = self._menu_build_about()
-        self._menu = self._menu_build_main()
+        # Menu variables
         self._menu_pid: int = 0
         self._menu_backdrop = pygame.Surface(self._screen.get_size())
         self._menu_backdrop.fill((50, 50, 50))
@@ -73,82 +84,75 @@ class DungeonCross:
 
         # System settings
         self._power_save = False
+        self._difficulty = 0
+        self._puzzle_filter = ""
 
         # Game variables
         self.game_won = False
         self._open_puzzle_id = -1
+        self._open_puzzle_num = -1
+        self._open_symmetry = 0
+        self._play_history = None
+        self._progress_store = None
         self._action_history = []
         self._action_history_idx = 0
         self._action_history_idx_top = 0
-        self._board_layout = []
+        self._board_layout = Bitboard()
         self._puzzle_book  = []
-        self._placed_walls = []
+        self._puzzle_book_file = ""
+        self._puzzle_index = None
+        self._filtered_puzzles = None
+        self._placed_walls = Bitboard()
         self._hint_x = [0] * 8
         self._hint_y = [0] * 8
-        self._x_err  = []
-        self._y_err  = []
-        self._x_lim  = []
-        self._y_lim  = []
-        self._map_hash: str = ""
+        self._x_err  = 0        # error/limit rows and columns are stored as 8-bit masks
+        self._y_err  = 0
+        self._x_lim  = 0
+        self._y_lim  = 0
+        self._fingerprint: int = 0
         self._mouse_action: MouseAction = MouseAction.NONE.value
-        self._check_board_state = False
+        self._drag_cell = (-1, -1)
         self._player_wins = 0
 
         # UI variables
         self._needs_display_update = True
+        self._dirty_cells = 0       # board cells to redraw, as a bitboard mask
+        self._dirty_hint_x = 0      # hint columns/rows to redraw, as 8-bit masks
+        self._dirty_hint_y = 0
+        self._update_rects = []
+        self._static_layer = pygame.Surface(self._screen.get_size())
         self._font_offset = 32
         self._font_pos_offset = self._font_offset / 2
         self._menu_is_open = False
         self._cb_mode = False
-
-        # error overlay
-        self._err_overlay_og = pygame.Surface((TILE_SIZE, TILE_SIZE))
-        self._err_overlay_og.fill((255, 0, 0))
-        self._err_overlay_og.set_alpha(120)
-
-        # colorblind error overlay
-        self._err_overlay_cb = pygame.Surface((TILE_SIZE, TILE_SIZE))
-        self._err_overlay_cb.fill((0, 100, 200))
-        self._err_overlay_cb.set_alpha(180)
-        err_overlay_sprite = self._load_sprite('sprite/error.png')
-        err_overlay_sprite.set_alpha(120)
-        self._err_overlay_cb.blit(err_overlay_sprite, (0, 0))
-
-        # set default error overlay to "normal" (not colorblind) mode
-        self._err_overlay = self._err_overlay_og
-
-        # limit overlay, used to show when a row/column has the needed number of walls
-        self._limit_overlay = pygame.Surface((TILE_SIZE, TILE_SIZE))
-        self._limit_overlay.fill((0, 0, 0))
-        self._limit_overlay.set_alpha(120)
-
-        # load sprites for both normal and colorblind modes
-        self._sprite_enemy_cb = self._load_sprite('sprite/cb_enemy.png')
-        self._sprite_enemy_og = self._load_sprite('sprite/enemy.png')
-        self._sprite_wall_cb  = self._load_sprite('sprite/cb_wall.png')
-        self._sprite_wall_og  = self._load_sprite('sprite/wall3.png')
-        self._sprite_mark_cb  = self._load_sprite('sprite/cb_mark.png')
-        self._sprite_mark_og  = self._load_sprite('sprite/mark4.png')
-        self._sprite_floor_og = self._load_sprite('sprite/floor4.png')
-        self._sprite_floor_cb = self._load_sprite('sprite/cb_floor2.png')
-        self._sprite_wall  = self._sprite_wall_og
-        self._sprite_mark  = self._sprite_mark_og
-        self._sprite_enemy = self._sprite_enemy_og
-        self._sprite_floor = self._sprite_floor_og
-        self._sprite_chest = self._load_sprite('sprite/chest.png')
-        self._sprite_frame = self._load_sprite('sprite/frame3.png')
-        self._sprite_book  = self._load_sprite('sprite/book.png')
-        self._sprite_win   = self._load_sprite('sprite/win.png', G_RESOLUTION[0], G_RESOLUTION[1])
-        self._sprite_number = []
-        for i in range(0, 9):
-            self._sprite_number.append(self._load_sprite(f"sprite/{i}.png", TILE_SIZE - self._font_offset, TILE_SIZE - self._font_offset))
-        pygame.display.set_icon(self._sprite_book)
-
-        # load sound effects
-        self._sound_win = self._sound.load_sfx('audio/sfx/level_win.mp3')
-        self._sound_wall = self._sound.load_sfx('audio/sfx/place_wall.mp3')
-        self._sound_mark = self._sound.load_sfx('audio/sfx/place_mark.mp3')
-        self._sound_open = self._sound.load_sfx('audio/sfx/level_open.mp3')
+        self._perf_overlay = False
+        self._perf_overlay_next = 0.0
+        self._perf_font = None
+
+        # start decoding sprites and loading sound effects on loader threads. The
+        # sprite atlas is built from the decoded images before the first puzzle opens
+        # (see _finish_loading), sound effects play once they're loaded
+        tile = (TILE_SIZE, TILE_SIZE)
+        number = (TILE_SIZE - self._font_offset, TILE_SIZE - self._font_offset)
+        self._sprite_specs = (
+            [(f"sprite/{name}.png", tile) for name in (
+                'error', 'cb_enemy', 'enemy', 'cb_wall', 'wall3', 'cb_mark', 'mark4', 
+                'floor4', 'cb_floor2', 'chest', 'frame3', 'book')] +
+            [(f"sprite/{i}.png", number) for i in range(0, 9)] +
+            [('sprite/win.png', G_RESOLUTION)]
+        )
+        self._sprite_atlas = None
+        self._sound_win = None
+        self._sound_wall = None
+        self._sound_mark = None
+        self._sound_open = None
+        loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="loader")
+        self._sprite_images = loader.submit(decode_sprites, [path for path, _ in self._sprite_specs])
+        loader.submit(self._load_sounds)
+        loader.shutdown(wait=False)
+
+        # menus are built the first time the menu is opened (see _get_menu)
+        self._menu = None
 
     @property
     def number_of_puzzles(self) -> int:
@@ -169,30 +173,64 @@ class DungeonCross:
         if val:
             self._needs_display_update = True
 
+    @property
+    def is_idle(self) -> bool:
+        """
+        True when nothing needs to be redrawn or shown in the menu, so the main
+        loop can sleep until the next event instead of polling. Mouse input is
+        handled from events, so drags don't keep the loop awake.
+        """
+
+        return not (self._menu_is_open or self._needs_display_update
+                    or self._dirty_cells or self._dirty_hint_x or self._dirty_hint_y)
+
+    @property
+    def target_fps(self) -> int:
+        """Frame rate the main loop should poll at while the game isn't idle."""
+        return POWER_SAVE_FPS if self._power_save else TARGET_FPS
+
     def update(self):
         """Main game update function. Should be called in main loop once per frame."""
         if not self._menu_is_open:
-            self._game_handle_mouse()
-            if not self._power_save or self._needs_display_update:
+            if self._needs_display_update:
                 self._draw_game()
                 self._needs_display_update = False
+            else:
+                self._draw_dirty()
+            if self._perf_overlay:
+                self._draw_perf_overlay()
         else:
-            self._menu.enable()
-            self._menu.mainloop(self._screen, bgfun=self._draw_game)
+            menu = self._get_menu()
+            menu.enable()
+            menu.mainloop(self._screen, bgfun=self._draw_game)
+
+    def pop_update_rects(self) -> list:
+        """
+        Returns the screen areas drawn since the last call, for pygame.display.update.
+        Empty if nothing on screen has changed.
+        """
+
+        rects = self._update_rects
+        self._update_rects = []
+        return rects
 
     @debug_timer
-    def load_puzzle_book(self, file_name: str = "puzzles.json.gz"):
-        """Loads a gzipped JSON file containing the puzzle data. Puzzles are stored as a list of lists."""
+    def load_puzzle_book(self, file_name: str = "puzzles.bin"):
+        """
+        Loads the puzzle book. Binary books are memory-mapped, older gzipped JSON
+        books are still accepted. Puzzles are decoded on demand when opened.
+        """
         logging.info(f"Opening puzzle book: {file_name}.")
         try:
-            with gzip.open(resource_path(file_name), 'r') as f:
-                self._puzzle_book = json.load(f)
-                f.close()
+            self._puzzle_book = puzzle_book.PuzzleBook(resource_path(file_name))
+            self._puzzle_book_file = resource_path(file_name)
+            self._puzzle_index = None
+            self._filtered_puzzles = None
             logging.info(f"{len(self._puzzle_book)} puzzles loaded.")
         except FileNotFoundError:
             logging.warning(f"Couldn't open file: {file_name}")
             raise
-        except json.JSONDecodeError:
+        except ValueError:
             logging.warning(f"Error reading file: {file_name}")
             raise
     
@@ -203,8 +241,10 @@ class DungeonCross:
         to puzzle #0. The two left-most digits determine the orientation of the 
         map. For example, map #1200045 can be viewed as map 1-2-00045, which will: 
             Load map number 00045 
-            Rotate the map 90-degrees clockwise twice (2)
-            Flip the map (1)
+            Rotate the map 90-degrees counter-clockwise twice (2)
+            Mirror the map left to right (1)
+        Together they cover all 8 symmetries of the board, so a puzzle book only
+        needs to store one orientation of each map.
         """
 
         logging.debug(f"Input fq_map_id: {fq_map_id}")
@@ -214,12 +254,14 @@ class DungeonCross:
         num: int = int(map_id_str[2:])
 
         logging.info(f"Opening puzzle #{num:05d} with modifiers r({rot}), f({flip}).")
+        self._finish_loading()
+        self._store_progress()
 
         # reset board data
         self._hint_x = [0] * 8
         self._hint_y = [0] * 8
-        self._x_err  = []
-        self._y_err  = []
+        self._x_err  = 0
+        self._y_err  = 0
 
         # reset user history
         self._action_history = []
@@ -227,56 +269,146 @@ class DungeonCross:
         self._action_history_idx_top = 0
 
         # if we attempt to load an invalid puzzle, default to puzzle 0
-        if num not in range(0, self.number_of_puzzles + 1):
+        if num not in range(0, self.number_of_puzzles):
             logging.error(f"Attempted to load invalid puzzle ID {num}")
             num = 0
 
         # load and setup game board
         self.game_won = False
         self._open_puzzle_id = fq_map_id
-        self._board_layout = deepcopy(self._puzzle_book[num])
+        self._open_puzzle_num = num
+        puzzle = self._puzzle_book[num]
+        self._board_layout = Bitboard(walls=puzzle.walls, enemies=puzzle.enemies, chests=puzzle.chests)
 
         # apply modifications after map load if needed
-        if rot != 0:
-            mp: numpy.ndarray = numpy.array(self._board_layout)
-            for _ in range(rot):
-                mp = numpy.rot90(mp)
-            self._board_layout = mp.tolist()
-        if flip != 0:
-            mp: numpy.ndarray = numpy.array(self._board_layout)
-            mp = numpy.flip(mp)
-            self._board_layout = mp.tolist()
+        symmetry = bitboard.transform_index(flip, rot)
+        self._open_symmetry = symmetry
+        self._board_layout = self._board_layout.transformed(symmetry)
+        self._fingerprint = self._puzzle_book.fingerprint(num, symmetry)
         
         # prepare rest of the board
         self._calc_hints()
         self._placed_walls = self._strip_walls()
-        self._check_board_state = False
+        self._restore_progress()
         self._sound.play_sfx(self._sound_open)
         self._update_hint_vars()
-        self._map_hash = hashlib.sha256(repr(self._board_layout).encode()).hexdigest()
-        self._menu.get_widget("PUZZLE_ID").set_value(f"{fq_map_id:07d}")
+        self._build_static_layer()
+        if self._menu is not None:
+            self._menu.get_widget("PUZZLE_ID").set_value(f"{fq_map_id:07d}")
         self._menu_pid = num
-        logging.debug(f"Map hash: {self._map_hash}")
+        logging.debug(f"Fingerprint: {self._fingerprint:016x}")
         pygame.display.set_caption(f"Dungeon Cross - {VERSION} - Puzzle #{fq_map_id:07d} - Wins: {self._player_wins}")
         self._needs_display_update = True
     
     def open_random_puzzle(self):
-        """Opens a random puzzle. Will not select the same puzzle twice in a row."""
-        pid = random.choice(range(0, len(self._puzzle_book)))
-        flip = random.randint(0, 1)
-        rot = random.randint(0, 3)
+        """
+        Opens a random puzzle of the selected difficulty. Will not select the
+        same puzzle twice in a row, in any orientation. With a play history,
+        puzzles that have already been won are skipped: without a filter or
+        difficulty the pick is uniform over every unplayed puzzle, otherwise
+        puzzles are drawn until one has an unplayed orientation.
+        """
+        current = self._open_puzzle_num
+        matches = self._get_filtered_puzzles()
+        if matches is not None and len(matches) == 0:
+            matches = None
+        history = self._play_history
+        pick = None
+        if history is not None and matches is None and self._difficulty == 0:
+            pick = history.random_unplayed(exclude=current)
+        if pick is not None:
+            pid, symmetry = pick
+            flip, rot = divmod(symmetry, 4)
+        else:
+            symmetry = -1
+            for _ in range(RANDOM_PUZZLE_TRIES):
+                pid = self._random_puzzle_number(matches, current)
+                if history is None:
+                    break
+                symmetry = history.unplayed_symmetry(pid)
+                if symmetry >= 0:
+                    break
+            if symmetry >= 0:
+                flip, rot = divmod(symmetry, 4)
+            else:
+                flip = random.randint(0, 1)
+                rot = random.randint(0, 3)
         pid = int(f"{flip:01d}{rot:01d}{pid:05d}")
-        if pid == self.current_puzzle_id:
-            pid = (pid + 1) % len(self._puzzle_book)
-        self._open_puzzle_id = pid
         self.open_puzzle(pid)
 
+    def reset_puzzle(self):
+        """Clears the board of the open puzzle, along with its saved progress."""
+        self._placed_walls = self._strip_walls()
+        self.open_puzzle(self.current_puzzle_id)
+
+    def _random_puzzle_number(self, matches, exclude: int) -> int:
+        """Picks a random puzzle number from the filter matches, or the selected difficulty band."""
+        if matches is None:
+            return self._puzzle_book.random_puzzle(self._difficulty - 1, exclude=exclude)
+        pid = int(matches[random.randrange(len(matches))])
+        if pid == exclude and len(matches) > 1:
+            pid = int(matches[(matches.searchsorted(pid) + random.randrange(1, len(matches))) % len(matches)])
+        return pid
+
+    def load_play_history(self, file_name: str = "dungeon_cross.played") -> None:
+        """
+        Opens the record of won puzzles for the loaded puzzle book, random
+        puzzles skip those from then on. Starts a new one if there's none, or
+        the book's puzzles have changed since it was written.
+        """
+        book = self._puzzle_book
+        try:
+            self._play_history = PlayHistory(get_save_path(file_name), len(book), book.content_key(scores=False))
+        except OSError as e:
+            logging.warning(f"Couldn't open play history, won puzzles may repeat: {e}")
+
+    def load_progress_store(self, file_name: str = "dungeon_cross.progress") -> None:
+        """
+        Opens the store of in-progress boards. From then on, leaving a puzzle
+        saves its board and opening one restores whatever was saved for it.
+        """
+        import sqlite3
+        import progress_store
+        try:
+            self._progress_store = progress_store.ProgressStore(get_save_path(file_name))
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Couldn't open progress store, only the open puzzle will be saved: {e}")
+
+    def _get_filtered_puzzles(self):
+        """
+        Returns the puzzle numbers that match the puzzle filter and difficulty,
+        or None if no filter is set or it can't be used. The book's feature
+        index is loaded (or built) the first time a filter is used.
+        """
+
+        if not self._puzzle_filter.strip():
+            return None
+        if self._filtered_puzzles is not None and self._filtered_puzzles[0] == (self._puzzle_filter, self._difficulty):
+            return self._filtered_puzzles[1]
+        try:
+            import puzzle_index
+            if self._puzzle_index is None:
+                self._puzzle_index = puzzle_index.PuzzleIndex.for_book(self._puzzle_book_file)
+            conditions = self._puzzle_filter.split()
+            if self._difficulty and "band" in self._puzzle_index.columns:
+                conditions.append(f"band={self._difficulty - 1}")
+            matches = self._puzzle_index.query(*conditions)
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Can't use puzzle filter '{self._puzzle_filter}': {e}")
+            matches = None
+        else:
+            logging.info(f"Puzzle filter '{self._puzzle_filter}' matches {len(matches)} puzzles.")
+            if len(matches) == 0:
+                logging.warning("No puzzles match the filter, picking from every puzzle.")
+        self._filtered_puzzles = ((self._puzzle_filter, self._difficulty), matches)
+        return matches
+
+    @profiler.profile("input")
     def handle_io_event(self, event: pygame.event.Event) -> bool:
         """Pass pygame events to this function. Returns false if ESCAPE key was pressed."""
         if not self._menu_is_open:
             if event.type == pygame.KEYDOWN:
-                self.needs_display_update = True
-                mods = pygame.key.get_mods()
+                mods = event.mod
                 shift_pressed = bool(mods & 0x1)
                 ctrl_pressed  = bool(mods & 0x40)
                 if event.key == pygame.K_ESCAPE:
@@ -285,22 +417,24 @@ class DungeonCross:
                     if event.key == pygame.K_SPACE:
                         self.open_random_puzzle()
                     elif event.key == pygame.K_r:
-                        self.open_puzzle(self.current_puzzle_id) 
+                        self.reset_puzzle()
                     elif event.key == pygame.K_z:
                         if ctrl_pressed:
                             if not shift_pressed:
-                                self._undo_action()
-                                self._update_hint_vars()
+                                self._update_hint_vars(self._undo_action())
                             else:
-                                self._redo_action()
-                                self._update_hint_vars()
+                                self._update_hint_vars(self._redo_action())
                     elif event.key == pygame.K_y and ctrl_pressed:
-                        self._redo_action()
-                        self._update_hint_vars()                        
+                        self._update_hint_vars(self._redo_action())
+                    elif event.key == pygame.K_F3 and profiler.PROFILER.enabled:
+                        self._perf_overlay = not self._perf_overlay
+                        self.needs_display_update = True
             elif event.type == pygame.MOUSEBUTTONDOWN:
-                lm = event.button == 1
-                rm = event.button == 3
-                self._game_handle_mouse(lm_event=lm, rm_event=rm)
+                self._mouse_button_down(event.pos, event.button)
+            elif event.type == pygame.MOUSEMOTION:
+                self._mouse_motion(event.pos, event.buttons)
+            elif event.type == pygame.MOUSEBUTTONUP:
+                self._mouse_button_up(event.button)
         return True
 
     ### Save game methods
@@ -317,32 +451,29 @@ class DungeonCross:
                 if not self._sound.enabled:
                     self._sound.stop_music()
                     self._sound.enabled = False
-                    self._menu.get_widget("SOUND").set_value(False)
 
                 # colorblind mode settings
                 self._cb_mode = data["CB_MODE"]
                 if self._cb_mode:
-                    w = self._menu.get_widget("CB_MODE")
-                    w.set_value(True)
-                    w._onchange(True)
+                    self._menu_set_cb_mode(True)
                 
                 # power save settings
                 self._power_save = data["PW_SAVE"]
                 if self._power_save:
-                    w = self._menu.get_widget("PW_SAVE")
-                    w.set_value(True)
-                    w._onchange(True)
+                    self._menu_power_save(True)
 
-                # open the last puzzle and reload user progress
+                # random puzzle difficulty and filter, missing from older saves
+                self._difficulty = data.get("DIFFICULTY", 0)
+                self._puzzle_filter = data.get("FILTER", "")
+
+                # open the last puzzle, its progress comes from the progress store.
+                # Saves from older versions, or made without a store, hold it instead
                 self.open_puzzle(data["LEVEL"])
-                logging.debug(f"Save hash: {data['MAPHASH']}")
-                if data["MAPHASH"] == self._map_hash:
-                    self._placed_walls = data["PROGRESS"]
-                    self._update_hint_vars()
+                if self._open_saved_puzzle(data):
+                    if "PROGRESS" in data:
+                        self._placed_walls = Bitboard.from_grid(data["PROGRESS"])
+                        self._update_hint_vars()
                 else:
-                    logging.warning("Map hash invalid for puzzle ID.")
-                    logging.warning(f"Expected: {data['MAPHASH']}")
-                    logging.warning(f"Actual  : {self._map_hash}")
                     self.open_random_puzzle()
             else:
                 self.open_random_puzzle()
@@ -358,72 +489,280 @@ class DungeonCross:
             save_data['SOUND'] = self._sound.enabled
             save_data['CB_MODE'] = self._cb_mode
             save_data['PW_SAVE'] = self._power_save
+            save_data['DIFFICULTY'] = self._difficulty
+            save_data['FILTER'] = self._puzzle_filter
             save_data["LEVEL"] = self.current_puzzle_id
-            save_data["PROGRESS"] = self._placed_walls
-            save_data["MAPHASH"] = self._map_hash
-            logging.debug(f"Save hash: {self._map_hash}")
+            save_data["FINGERPRINT"] = self._fingerprint
+            if self._progress_store is not None:
+                self._store_progress()
+            else:
+                save_data["PROGRESS"] = self._placed_walls.to_grid()
+            logging.debug(f"Save fingerprint: {self._fingerprint:016x}")
             self._save_file.store_save_data(save_data)
         except Exception as e:  # temporary catchall
             logging.error(f"Could not save to save file. \n{e}")
 
+    def _store_progress(self) -> None:
+        """
+        Saves the board of the open puzzle to the progress store, or removes it
+        once the puzzle is won.
+        """
+        if self._progress_store is None or self._open_puzzle_num < 0:
+            return
+        if self.game_won:
+            self._progress_store.remove(self._fingerprint)
+        else:
+            board = self._placed_walls
+            self._progress_store.put(self._fingerprint, board.walls, board.marks, self.current_puzzle_id)
+
+    def _restore_progress(self) -> None:
+        """Puts back the saved walls and marks of the puzzle that's being opened, if it has any."""
+        if self._progress_store is None:
+            return
+        saved = self._progress_store.get(self._fingerprint)
+        if saved is not None:
+            fixed = self._board_layout.enemies | self._board_layout.chests
+            self._placed_walls.walls = saved[0] & ~fixed
+            self._placed_walls.marks = saved[1] & ~fixed & ~saved[0]
+            logging.info("Restored saved progress.")
+
+    def _open_saved_puzzle(self, data: dict) -> bool:
+        """
+        Checks that the open puzzle is the one in the save data. If the puzzle
+        book was rebuilt since and the saved ID now points at another puzzle,
+        the saved puzzle is looked up by fingerprint and opened. Returns False
+        if it isn't in the book anymore.
+        """
+
+        if "FINGERPRINT" not in data:
+
+            # saves from older versions hold a hash of the board instead
+            import hashlib
+            actual = hashlib.sha256(repr(self._board_layout.to_grid()).encode()).hexdigest()
+            if data.get("MAPHASH") == actual:
+                return True
+            logging.warning("Map hash invalid for puzzle ID.")
+            return False
+        saved = data["FINGERPRINT"]
+        logging.debug(f"Save fingerprint: {saved:016x}")
+        if saved == self._fingerprint:
+            return True
+        logging.warning("Fingerprint invalid for puzzle ID.")
+        logging.warning(f"Expected: {saved:016x}")
+        logging.warning(f"Actual  : {self._fingerprint:016x}")
+        found = self._puzzle_book.find_fingerprint(saved)
+        if found is None:
+            return False
+        num, symmetry = found
+        fq_map_id = int(f"{symmetry // 4:01d}{symmetry % 4:01d}{num:05d}")
+        logging.info(f"Saved puzzle found as #{fq_map_id:07d}.")
+        self.open_puzzle(fq_map_id)
+        return True
+
+    def _finish_loading(self):
+        """
+        Waits for the loader thread to decode the sprites, then builds the sprite
+        atlas, overlays and sprite sets. Called before anything needs a sprite,
+        only does work the first time.
+        """
+
+        if self._sprite_atlas is not None:
+            return
+        # pack every sprite into display-format atlases
+        self._sprite_atlas = SpriteAtlas(self._sprite_specs, decoded=self._sprite_images.result())
+
+        # error overlay
+        self._err_overlay_og = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        self._err_overlay_og.fill((255, 0, 0))
+        self._err_overlay_og.set_alpha(120)
+
+        # colorblind error overlay
+        self._err_overlay_cb = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        self._err_overlay_cb.fill((0, 100, 200))
+        self._err_overlay_cb.set_alpha(180)
+        err_overlay_sprite = self._load_sprite('sprite/error.png').copy()
+        err_overlay_sprite.set_alpha(120)
+        self._err_overlay_cb.blit(err_overlay_sprite, (0, 0))
+
+        # set default error overlay to "normal" (not colorblind) mode
+        self._err_overlay = self._err_overlay_og
+
+        # limit overlay, used to show when a row/column has the needed number of walls
+        self._limit_overlay = pygame.Surface((TILE_SIZE, TILE_SIZE))
+        self._limit_overlay.fill((0, 0, 0))
+        self._limit_overlay.set_alpha(120)
+
+        # load sprites for both normal and colorblind modes
+        self._sprite_enemy_cb = self._load_sprite('sprite/cb_enemy.png')
+        self._sprite_enemy_og = self._load_sprite('sprite/enemy.png')
+        self._sprite_wall_cb  = self._load_sprite('sprite/cb_wall.png')
+        self._sprite_wall_og  = self._load_sprite('sprite/wall3.png')
+        self._sprite_mark_cb  = self._load_sprite('sprite/cb_mark.png')
+        self._sprite_mark_og  = self._load_sprite('sprite/mark4.png')
+        self._sprite_floor_og = self._load_sprite('sprite/floor4.png')
+        self._sprite_floor_cb = self._load_sprite('sprite/cb_floor2.png')
+        self._sprite_wall  = self._sprite_wall_og
+        self._sprite_mark  = self._sprite_mark_og
+        self._sprite_enemy = self._sprite_enemy_og
+        self._sprite_floor = self._sprite_floor_og
+        self._sprite_chest = self._load_sprite('sprite/chest.png')
+        self._sprite_frame = self._load_sprite('sprite/frame3.png')
+        self._sprite_book  = self._load_sprite('sprite/book.png')
+        self._sprite_win   = self._load_sprite('sprite/win.png', G_RESOLUTION[0], G_RESOLUTION[1])
+        self._sprite_number = []
+        for i in range(0, 9):
+            self._sprite_number.append(self._load_sprite(f"sprite/{i}.png", TILE_SIZE - self._font_offset, TILE_SIZE - self._font_offset))
+        pygame.display.set_icon(self._sprite_book)
+
+    def _load_sounds(self):
+        """
+        Loads the sound effects. Runs on a loader thread, so load_save may turn
+        sound off before it gets here; the effects are loaded either way.
+        """
+        try:
+            self._sound_win = self._sound.load_sfx('audio/sfx/level_win.mp3', force=True)
+            self._sound_wall = self._sound.load_sfx('audio/sfx/place_wall.mp3', force=True)
+            self._sound_mark = self._sound.load_sfx('audio/sfx/place_mark.mp3', force=True)
+            self._sound_open = self._sound.load_sfx('audio/sfx/level_open.mp3', force=True)
+        except Exception as e:
+            logging.error(f"Could not load sound effects: {e}")
+
     def _load_sprite(self, path: str, size_x: int = TILE_SIZE, size_y: int = TILE_SIZE) -> pygame.image:
         """
         Load a sprite of a given size (size_x, size_y), returns the pygame image.
         This should be called rather than directly calling pygame.image.load because
         it automatically detects the correct path of the asset, whether the program 
         is running from the main directory or if it's compiled as a standalone executable.
+        Sprites come from the sprite atlas, so the returned image is shared and 
+        should be copied before being modified.
         """
 
-        logging.debug(f"Loading sprite: {path}. Size ({size_x}, {size_y})")
-        try:
-            image = pygame.image.load(resource_path(path))
-            return pygame.transform.scale(image, (size_x, size_x))
-        except FileNotFoundError:
-            logging.critical(f"Could not open sprite: {path}")
-            raise
+        return self._sprite_atlas.get(path, (size_x, size_y))
 
-    def _undo_action(self):
-        """Undo a move from the user. Retains history for Redo function."""
+    def _undo_action(self) -> HistoryAction:
+        """Undo a move from the user. Retains history for Redo function. Returns the action undone, if any."""
         if self._action_history_idx > 0:
             self._action_history_idx -= 1
             action: HistoryAction = self._action_history[self._action_history_idx]
-            self._placed_walls[action.y][action.x] = action.old_state
+            self._placed_walls.set(action.x, action.y, action.old_state)
+            self._mark_dirty(action)
+            return action
 
-    def _redo_action(self):
-        """Redo an action after an undo was made."""
+    def _redo_action(self) -> HistoryAction:
+        """Redo an action after an undo was made. Returns the action redone, if any."""
         if self._action_history_idx < self._action_history_idx_top:
             action: HistoryAction = self._action_history[self._action_history_idx]
             self._action_history_idx += 1
-            self._placed_walls[action.y][action.x] = action.new_state
+            self._placed_walls.set(action.x, action.y, action.new_state)
+            self._mark_dirty(action)
+            return action
 
 
     ### Draw Methods
+    @profiler.profile("draw_game")
     def _draw_game(self):
         """
         Redraws the entire game board. This should be called by the engine and not by
-        the user. This function should only run when there has been a change to the 
-        game board itself, or if the window has changed focus states.
+        the user. This function should only run when the whole screen needs to be
+        redrawn: a new puzzle was opened, the menu was opened or closed, or the window
+        has changed focus states. Single cell changes go through _draw_dirty instead.
 
         Render processs goes like:
-            1. Draw outer hint frame
-            2. Draw the map tiles (minus the walls) from the puzzle book answer
-            3. Draw the user-placed walls/marks
-            4. Draw the error overlays on the hint frame
-            5. Draw the limit overlays on the hint frame
+            1. Draw the static layer (see _build_static_layer)
+            2. Draw the user-placed walls/marks
+            3. Draw the error/limit overlays on the hint frame
+            4. Draw the win screen or menu backdrop over everything
         """
         
-        self._draw_frame()
-        for y in range(1, 9):
-            for x in range(1, 9):
-                self._screen.blit(self._sprite_floor, (x * TILE_SIZE, y * TILE_SIZE))
-        self._draw_map_tiles(show_wall=False)
-        self._draw_placed_objects()
-        self._draw_errors()
-        self._draw_limit()
+        self._screen.blit(self._static_layer, (0, 0))
+        for pos in bitboard.iter_cells(self._placed_walls.walls):
+            self._draw_sprite(self._sprite_wall, pos)
+        for pos in bitboard.iter_cells(self._placed_walls.marks):
+            self._draw_sprite(self._sprite_mark, pos)
+        for i in range(8):
+            self._draw_hint_overlay(((i + 1) * TILE_SIZE, 0), self._x_err >> i & 1, self._x_lim >> i & 1)
+            self._draw_hint_overlay((0, (i + 1) * TILE_SIZE), self._y_err >> i & 1, self._y_lim >> i & 1)
         if self.game_won:
             self._screen.blit(self._sprite_win, (0, 0))
         if self._menu_is_open:
             self._screen.blit(self._menu_backdrop, (0, 0))
+        self._dirty_cells = 0
+        self._dirty_hint_x = 0
+        self._dirty_hint_y = 0
+        self._update_rects = [self._screen.get_rect()]
+
+    @profiler.profile("draw_dirty")
+    def _draw_dirty(self):
+        """
+        Redraws only the board cells and hints that changed since the last frame and
+        queues their rects for pop_update_rects. Cells are marked by _mark_dirty,
+        hints by _update_hint_vars.
+        """
+
+        for x, y in bitboard.iter_cells(self._dirty_cells):
+            self._update_rects.append(self._draw_cell(x, y))
+        for i in range(8):
+            if self._dirty_hint_x >> i & 1:
+                self._update_rects.append(self._draw_hint_column(i))
+            if self._dirty_hint_y >> i & 1:
+                self._update_rects.append(self._draw_hint_row(i))
+        self._dirty_cells = 0
+        self._dirty_hint_x = 0
+        self._dirty_hint_y = 0
+
+    def _mark_dirty(self, action: HistoryAction):
+        """Queues the cell changed by a user action to be redrawn on the next frame."""
+        self._dirty_cells |= bitboard.cell_bit(action.x, action.y)
+
+    def _draw_perf_overlay(self):
+        """
+        Draws the profiler stats in a box at the bottom of the screen. The box is
+        redrawn when anything under it may have been drawn over, or twice a second
+        to refresh the numbers.
+        """
+
+        now = time.monotonic()
+        if not self._update_rects and now < self._perf_overlay_next:
+            return
+        self._perf_overlay_next = now + 0.5
+        if self._perf_font is None:
+            self._perf_font = pygame.font.Font(None, 20)
+        lines = profiler.PROFILER.format_stats() or ["No samples yet"]
+        line_height = self._perf_font.get_linesize()
+        rect = pygame.Rect(0, 0, self._screen.get_width(), line_height * len(lines) + 8)
+        rect.bottom = self._screen.get_height()
+        self._screen.fill((0, 0, 0), rect)
+        for i, line in enumerate(lines):
+            text = self._perf_font.render(line, True, (255, 255, 255))
+            self._screen.blit(text, (4, rect.top + 4 + i * line_height))
+        self._update_rects.append(rect)
+
+    def _build_static_layer(self):
+        """
+        Composites everything that doesn't change while a puzzle is open onto
+        _static_layer: the hint frame and numbers, the book icon, the floor, and
+        the puzzle's enemies and chests. Needs to be rebuilt when a puzzle is
+        opened or the sprite set changes.
+        """
+
+        layer = self._static_layer
+        layer.blit(self._sprite_frame, (0, 0))
+        layer.blit(self._sprite_book, (0, 0))
+        for i in range(1, 9):
+            hint_x = self._sprite_number[self._hint_x[i - 1]]
+            hint_y = self._sprite_number[self._hint_y[i - 1]]
+            layer.blit(self._sprite_frame, (i * TILE_SIZE, 0))
+            layer.blit(self._sprite_frame, (0, i * TILE_SIZE))
+            layer.blit(hint_x, (i * TILE_SIZE + self._font_pos_offset, self._font_pos_offset))
+            layer.blit(hint_y, (self._font_pos_offset, i * TILE_SIZE + self._font_pos_offset))
+        for y in range(1, 9):
+            for x in range(1, 9):
+                layer.blit(self._sprite_floor, (x * TILE_SIZE, y * TILE_SIZE))
+        for x, y in bitboard.iter_cells(self._board_layout.enemies):
+            layer.blit(self._sprite_enemy, ((x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE))
+        for x, y in bitboard.iter_cells(self._board_layout.chests):
+            layer.blit(self._sprite_chest, ((x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE))
+        self.needs_display_update = True
 
     def _draw_sprite(self, sprite: pygame.image, grid_pos: tuple):
         """
@@ -435,221 +774,282 @@ class DungeonCross:
         pos_y = (grid_pos[1] + 1) * TILE_SIZE
         self._screen.blit(sprite, (pos_x, pos_y))
 
-    def _draw_placed_objects(self):
-        """Draws all user-placed objects on board. Should be called after _draw_map_tiles"""
-        for y, row in enumerate(self._placed_walls):
-            for x, obj in enumerate(row):
-                if obj == MapObject.WALL.value:
-                    self._draw_sprite(self._sprite_wall, (x, y))
-                elif obj == MapObject.MARK.value:
-                    self._draw_sprite(self._sprite_mark, (x, y))
-
-    def _draw_map_tiles(self, show_wall: bool = False):
-        """
-        Draws the map to the board including enemies and chests.
-        If show_wall is True, it also draws the walls for the map.
-        """
-
-        for y, row in enumerate(self._board_layout):
-            for x, obj in enumerate(row):
-                if show_wall and obj == MapObject.WALL.value:
-                    self._draw_sprite(self._sprite_wall, (x, y))
-                elif obj == MapObject.ENEMY.value:
-                    self._draw_sprite(self._sprite_enemy, (x, y))
-                elif obj == MapObject.CHEST.value:
-                    self._draw_sprite(self._sprite_chest, (x, y))
-
-    def _draw_errors(self):
-        """Draws a red overlay over the hint numbers based on the values in _x_err and _y_err."""
-        for i in self._x_err:
-            self._screen.blit(self._err_overlay, ((i + 1) * TILE_SIZE, 0))
-        for i in self._y_err:
-            self._screen.blit(self._err_overlay, (0, (i + 1) * TILE_SIZE))
-
-    def _draw_limit(self):
-        """Draws a grey overlay over the hint numbers based on the values in _x_lim and _y_lim."""
-        for i in self._x_lim:
-            self._screen.blit(self._limit_overlay, ((i + 1) * TILE_SIZE, 0))
-        for i in self._y_lim:
-            self._screen.blit(self._limit_overlay, (0, (i + 1) * TILE_SIZE))
-
-    def _draw_frame(self):
-        """Draws the outer frame of the board along with the wall hints."""
-        for i in range(1, 9):
-            hint_x = self._sprite_number[self._hint_x[i - 1]]
-            hint_y = self._sprite_number[self._hint_y[i - 1]]
-            self._screen.blit(self._sprite_frame, (i * TILE_SIZE, 0))
-            self._screen.blit(self._sprite_frame, (0, i * TILE_SIZE))
-            self._screen.blit(hint_x, (i * TILE_SIZE + self._font_pos_offset, self._font_pos_offset))
-            self._screen.blit(hint_y, (self._font_pos_offset, i * TILE_SIZE + self._font_pos_offset))
-        self._screen.blit(self._sprite_frame, (0, 0))
-        self._screen.blit(self._sprite_book, (0, 0))
+    def _draw_cell(self, x: int, y: int) -> pygame.Rect:
+        """
+        Draws a single board cell: the static layer under it, then the user-placed
+        wall or mark. Returns the screen rect of the cell.
+        """
+
+        bit = bitboard.cell_bit(x, y)
+        rect = pygame.Rect((x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        self._screen.blit(self._static_layer, rect, rect)
+        if self._placed_walls.walls & bit:
+            self._draw_sprite(self._sprite_wall, (x, y))
+        elif self._placed_walls.marks & bit:
+            self._draw_sprite(self._sprite_mark, (x, y))
+        return rect
+
+    def _draw_hint_column(self, x: int) -> pygame.Rect:
+        """Draws the hint above column x with its error/limit overlay. Returns its screen rect."""
+        rect = pygame.Rect((x + 1) * TILE_SIZE, 0, TILE_SIZE, TILE_SIZE)
+        self._screen.blit(self._static_layer, rect, rect)
+        self._draw_hint_overlay(rect.topleft, self._x_err >> x & 1, self._x_lim >> x & 1)
+        return rect
+
+    def _draw_hint_row(self, y: int) -> pygame.Rect:
+        """Draws the hint left of row y with its error/limit overlay. Returns its screen rect."""
+        rect = pygame.Rect(0, (y + 1) * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        self._screen.blit(self._static_layer, rect, rect)
+        self._draw_hint_overlay(rect.topleft, self._y_err >> y & 1, self._y_lim >> y & 1)
+        return rect
+
+    def _draw_hint_overlay(self, pos: tuple, err: bool, lim: bool):
+        """Draws the error and/or limit overlay over the hint at pixel position pos."""
+        if err:
+            self._screen.blit(self._err_overlay, pos)
+        if lim:
+            self._screen.blit(self._limit_overlay, pos)
 
 
     ### Mouse input methods
-    def _get_mouse_to_grid(self) -> tuple:
-        """"Snaps" the mouse position to the board grid. Returns mouse's position on grid."""
-        pos_x, pos_y = pygame.mouse.get_pos()
-        pos_x = math.floor((pos_x / TILE_SIZE) - 1)
-        pos_y = math.floor((pos_y / TILE_SIZE) - 1)
+    def _get_mouse_to_grid(self, pos: tuple) -> tuple:
+        """"Snaps" a mouse position to the board grid. Returns the position on grid."""
+        pos_x = math.floor((pos[0] / TILE_SIZE) - 1)
+        pos_y = math.floor((pos[1] / TILE_SIZE) - 1)
         pos_x = max(min(8, pos_x), -1)
         pos_y = max(min(8, pos_y), -1)
         return(pos_x, pos_y)
 
-    def _game_handle_mouse(self, lm_event: bool = False, rm_event: bool = False):
+    @staticmethod
+    def _grid_line(start: tuple, end: tuple):
+        """Yields every grid cell on the line from start to end (Bresenham), start excluded."""
+        x, y = start
+        x1, y1 = end
+        dx = abs(x1 - x)
+        dy = -abs(y1 - y)
+        sx = 1 if x < x1 else -1
+        sy = 1 if y < y1 else -1
+        err = dx + dy
+        while x != x1 or y != y1:
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x += sx
+            if e2 <= dx:
+                err += dx
+                y += sy
+            yield x, y
+
+    def _mouse_button_down(self, pos: tuple, button: int):
         """
-        Handles all mouse input/actions. If a user-placed wall is changed, it will automatically
-        call the routines to check for a win condition or if an error is made.
-
-        Modifies: 
-            self._placed_walls
+        Starts a mouse action from a left (1) or right (3) click. The action is picked
+        from the clicked tile and is applied to every cell dragged over until the
+        button is released. Left clicking the book icon opens the menu.
         """
 
-        mx, my      = self._get_mouse_to_grid()
-        user_tile   = self._placed_walls[my][mx]
-        map_tile    = self._board_layout[my][mx]
-        mouse_press = pygame.mouse.get_pressed()
-        click_lmb   = mouse_press[0] or lm_event
-        click_rmb   = mouse_press[2] or rm_event
-
-        # reset mouse action if no buttons are being pressed
-        if not True in [click_lmb, click_rmb] and self._mouse_action != MouseAction.NONE.value:
-            self._mouse_action = MouseAction.NONE.value
-
-        # update mouse action if not already set
-        if mx >= 0 and my >= 0:
-            if not self.game_won:
-                if self._mouse_action == MouseAction.NONE.value:
-                    if click_lmb:
-                        if user_tile:
-                            self._mouse_action = MouseAction.REMOVE_WALL.value
-                        else:
-                            self._mouse_action = MouseAction.PLACE_WALL.value
-                    elif click_rmb:
-                        if user_tile:
-                            self._mouse_action = MouseAction.REMOVE_MARK.value
-                        else:
-                            self._mouse_action = MouseAction.PLACE_MARK.value                 
-
-                # update user tiles based on mouse location and action
-                if self._mouse_action:
-                    if map_tile in [MapObject.EMPTY.value, MapObject.WALL.value]:
-                        update_history = False
-                        old_state = self._placed_walls[my][mx]
-                        if self._mouse_action == MouseAction.PLACE_WALL.value:
-                            if user_tile == MapObject.EMPTY.value:
-                                self._placed_walls[my][mx] = MapObject.WALL.value
-                                self._check_board_state = True
-                                self._sound.play_sfx(self._sound_wall)
-                                update_history = True
-                                self.needs_display_update = True
-                        elif self._mouse_action == MouseAction.REMOVE_WALL.value:
-                            if user_tile == MapObject.WALL.value:
-                                self._placed_walls[my][mx] = MapObject.EMPTY.value
-                                self._check_board_state = True
-                                self._sound.play_sfx(self._sound_wall)
-                                update_history = True
-                                self.needs_display_update = True
-                        elif self._mouse_action == MouseAction.PLACE_MARK.value:
-                            if user_tile == MapObject.EMPTY.value:
-                                self._placed_walls[my][mx] = MapObject.MARK.value
-                                self._sound.play_sfx(self._sound_mark)
-                                update_history = True
-                                self.needs_display_update = True
-                        elif self._mouse_action == MouseAction.REMOVE_MARK.value:
-                            if user_tile == MapObject.MARK.value:
-                                self._placed_walls[my][mx] = MapObject.EMPTY.value                   
-                                self._sound.play_sfx(self._sound_mark) 
-                                update_history = True
-                                self.needs_display_update = True
-                        if update_history:
-
-                            # update history with this move. If we've done an undo in
-                            # the past, reset the 'top' pointer to start overwriting 
-                            # old actions
-                            this_action = HistoryAction(mx, my, old_state, self._placed_walls[my][mx])
-                            try:
-                                self._action_history[self._action_history_idx] = this_action
-                            except IndexError:
-                                self._action_history.append(this_action)
-                            self._action_history_idx += 1
-                            self._action_history_idx_top = self._action_history_idx
-
-            # if a user wall has changed, check for errors/win condition
-            if self._check_board_state:
-                self._update_hint_vars()
-                self._check_win()
-                self._check_board_state = False
-        elif mx == -1 and my == -1:      # if user has clicked on book icon
-            if click_lmb and not self._mouse_action:
+        if button not in (1, 3):
+            return
+        if self._mouse_action not in (MouseAction.NONE.value, MouseAction.MENU_ACTION.value):
+            return
+        mx, my = self._get_mouse_to_grid(pos)
+        if mx == -1 and my == -1:      # if user has clicked on book icon
+            if button == 1:
                 self._mouse_action = MouseAction.MENU_ACTION.value
                 self._menu_is_open = True
+                self.needs_display_update = True
                 logging.debug("MENU OPEN")
+        else:
+            self._start_mouse_action(mx, my, button == 1)
+
+    def _mouse_motion(self, pos: tuple, buttons: tuple):
+        """
+        Continues a drag. The mouse action is applied to each cell between the last
+        cell and the one under the mouse now, so fast drags don't skip cells.
+        """
+
+        if not (buttons[0] or buttons[2]):
+            self._mouse_action = MouseAction.NONE.value
+            return
+        mx, my = self._get_mouse_to_grid(pos)
+        if self._mouse_action == MouseAction.NONE.value:
+            # a drag that started off the board starts its action on the first cell it enters
+            self._start_mouse_action(mx, my, bool(buttons[0]))
+        elif self._mouse_action != MouseAction.MENU_ACTION.value:
+            for x, y in self._grid_line(self._drag_cell, (mx, my)):
+                self._apply_mouse_action(x, y)
+            self._drag_cell = (mx, my)
+
+    def _mouse_button_up(self, button: int):
+        """Ends the current mouse action."""
+        if button in (1, 3):
+            self._mouse_action = MouseAction.NONE.value
+
+    def _start_mouse_action(self, mx: int, my: int, left: bool):
+        """Picks the mouse action based on the tile at (mx, my) and applies it there."""
+        if not (0 <= mx < 8 and 0 <= my < 8) or self.game_won:
+            return
+        user_tile = self._placed_walls.get(mx, my)
+        if left:
+            if user_tile:
+                self._mouse_action = MouseAction.REMOVE_WALL.value
+            else:
+                self._mouse_action = MouseAction.PLACE_WALL.value
+        else:
+            if user_tile:
+                self._mouse_action = MouseAction.REMOVE_MARK.value
+            else:
+                self._mouse_action = MouseAction.PLACE_MARK.value
+        self._drag_cell = (mx, my)
+        self._apply_mouse_action(mx, my)
+
+    def _apply_mouse_action(self, mx: int, my: int):
+        """
+        Applies the current mouse action to a single cell. If a user-placed wall is
+        changed, it will automatically call the routines to check for a win condition
+        or if an error is made.
+
+        Modifies: 
+            self._placed_walls
+        """
+
+        if not (0 <= mx < 8 and 0 <= my < 8) or self.game_won:
+            return
+        map_tile = self._board_layout.get(mx, my)
+        if map_tile not in [MapObject.EMPTY.value, MapObject.WALL.value]:
+            return
+        user_tile = self._placed_walls.get(mx, my)
+        wall_changed = False
+        if self._mouse_action == MouseAction.PLACE_WALL.value:
+            if user_tile == MapObject.EMPTY.value:
+                self._placed_walls.set(mx, my, MapObject.WALL.value)
+                self._sound.play_sfx(self._sound_wall)
+                wall_changed = True
+        elif self._mouse_action == MouseAction.REMOVE_WALL.value:
+            if user_tile == MapObject.WALL.value:
+                self._placed_walls.set(mx, my, MapObject.EMPTY.value)
+                self._sound.play_sfx(self._sound_wall)
+                wall_changed = True
+        elif self._mouse_action == MouseAction.PLACE_MARK.value:
+            if user_tile == MapObject.EMPTY.value:
+                self._placed_walls.set(mx, my, MapObject.MARK.value)
+                self._sound.play_sfx(self._sound_mark)
+        elif self._mouse_action == MouseAction.REMOVE_MARK.value:
+            if user_tile == MapObject.MARK.value:
+                self._placed_walls.set(mx, my, MapObject.EMPTY.value)                   
+                self._sound.play_sfx(self._sound_mark) 
+        new_state = self._placed_walls.get(mx, my)
+        if new_state == user_tile:
+            return
+
+        # update history with this move. If we've done an undo in
+        # the past, reset the 'top' pointer to start overwriting 
+        # old actions
+        this_action = HistoryAction(mx, my, user_tile, new_state)
+        self._mark_dirty(this_action)
+        try:
+            self._action_history[self._action_history_idx] = this_action
+        except IndexError:
+            self._action_history.append(this_action)
+        self._action_history_idx += 1
+        self._action_history_idx_top = self._action_history_idx
+
+        # if a user wall has changed, check for errors/win condition
+        if wall_changed:
+            self._update_hint_vars(this_action)
+            self._check_win()
     
     ### game logic
+    @profiler.profile("check_win")
     def _check_win(self):
-        """Checks to see if the user-modified board matches the puzzle book board."""
-        user_board = self._strip_marks()
-        if self._board_layout == user_board:
+        """
+        Checks to see if the user-placed walls solve the puzzle. Any wall layout that
+        follows the puzzle rules wins, not just the one in the puzzle book. The rules
+        are only checked once every row and column matches its hint.
+        """
+
+        if self._x_lim != 0xFF or self._y_lim != 0xFF:
+            return
+        import solver
+        board = self._board_layout
+        if solver.check_walls(self._placed_walls.walls, board.enemies, board.chests):
             self._sound.play_sfx(self._sound_win)
             self.game_won = True
             self._player_wins += 1
+            if self._play_history is not None:
+                self._play_history.mark(self._open_puzzle_num, self._open_symmetry)
+            self.needs_display_update = True
     
-    def _update_hint_vars(self):
+    @profiler.profile("update_hints")
+    def _update_hint_vars(self, action: HistoryAction = None):
         """
-        Generates the sum of user-placed walls by row and column. Checks to see 
-        if any of those user values exceed the generated hints from the puzzle.
-        Updates the error arrays x_err and y_err with the indexes of the errors.
+        Counts the user-placed walls by row and column. Checks to see if any of
+        those user values exceed the generated hints from the puzzle. Updates the
+        error masks x_err and y_err with a bit set for each row/column in error.
+        If the action that changed the board is given, only its row and column
+        are updated. Hints whose error/limit state changed are queued for redraw.
         """
 
-        x_sum = []
-        y_sum = []
-
-        # calculate sums of placed walls row/columns
-        for i, v in enumerate(self._placed_walls):
-            y_sum.append(v.count(MapObject.WALL.value))
-        for x in range(8):
-            e_sum = 0
-            for y in range(8):
-                if self._placed_walls[y][x] == MapObject.WALL.value:
-                    e_sum = e_sum + 1
-            x_sum.append(e_sum)
-        
-        # get indexes of errors when compared to the hint frame
-        self._x_err = [i for i, v in enumerate(x_sum) if v > self._hint_x[i]]
-        self._y_err = [i for i, v in enumerate(y_sum) if v > self._hint_y[i]]
-
-        # get indexes of limits against hint frame
-        self._x_lim = [i for i, v in enumerate(x_sum) if v == self._hint_x[i]]
-        self._y_lim = [i for i, v in enumerate(y_sum) if v == self._hint_y[i]]
-
-    def _strip_walls(self) -> list:
+        x_old = self._x_err | self._x_lim << 8
+        y_old = self._y_err | self._y_lim << 8
+        if action is not None:
+            self._update_hint_column(action.x)
+            self._update_hint_row(action.y)
+        else:
+            for i in range(8):
+                self._update_hint_column(i)
+                self._update_hint_row(i)
+        x_diff = x_old ^ (self._x_err | self._x_lim << 8)
+        y_diff = y_old ^ (self._y_err | self._y_lim << 8)
+        self._dirty_hint_x |= (x_diff | x_diff >> 8) & 0xFF
+        self._dirty_hint_y |= (y_diff | y_diff >> 8) & 0xFF
+
+    def _update_hint_column(self, x: int):
+        """Updates the error/limit bits of a single column. See _update_hint_vars."""
+        x_sum = bitboard.column_count(self._placed_walls.walls, x)
+        bit = 1 << x
+        self._x_err &= ~bit
+        self._x_lim &= ~bit
+        if x_sum > self._hint_x[x]:
+            self._x_err |= bit
+        elif x_sum == self._hint_x[x]:
+            self._x_lim |= bit
+
+    def _update_hint_row(self, y: int):
+        """Updates the error/limit bits of a single row. See _update_hint_vars."""
+        y_sum = bitboard.row_count(self._placed_walls.walls, y)
+        bit = 1 << y
+        self._y_err &= ~bit
+        self._y_lim &= ~bit
+        if y_sum > self._hint_y[y]:
+            self._y_err |= bit
+        elif y_sum == self._hint_y[y]:
+            self._y_lim |= bit
+
+    def _strip_walls(self) -> Bitboard:
         """Removes walls from loaded puzzle. Used to generate the 'user board'."""
-        out = []
-        for row in self._board_layout:
-            out.append([v if v != MapObject.WALL.value else MapObject.EMPTY.value for v in row])
-        return out
-
-    def _strip_marks(self) -> list:
-        """Returns a list of the board with all user-placed marks removed. Used by _check_win"""
-        out = []
-        for row in self._placed_walls:
-            out.append([v if v != MapObject.MARK.value else MapObject.EMPTY.value for v in row])
-        return out        
+        return Bitboard(enemies=self._board_layout.enemies, chests=self._board_layout.chests)
 
     def _calc_hints(self) -> None:
         """Calculates the hint numbers for the border. Updates _hint_x and _hint_y"""
-        for i, v in enumerate(self._board_layout):
-            self._hint_y[i] = v.count(MapObject.WALL.value)
-        for x in range(8):
-            sum_y = 0
-            for y in range(8):
-                if self._board_layout[y][x] == MapObject.WALL.value:
-                    sum_y = sum_y + 1
-            self._hint_x[x] = sum_y
+        for i in range(8):
+            self._hint_x[i] = self._board_layout.column_count(i)
+            self._hint_y[i] = self._board_layout.row_count(i)
 
 
     ### Methods for building the menus. I'd love to move these methods out of this file because they look dumb.
+    def _get_menu(self) -> "pygame_menu.Menu":
+        """
+        Returns the main menu. The menus are built, and pygame_menu imported, the
+        first time the menu is opened. Widgets start out matching the current settings.
+        """
+
+        if self._menu is None:
+            self._menu_theme = self._menu_build_theme()
+            self._menu_tutorial = self._menu_build_tutorial()
+            self._menu_about = self._menu_build_about()
+            self._menu = self._menu_build_main()
+        return self._menu
+
     # Menu callback methods. These are called directly by the pygame_menu widgets.
     def _menu_open_map(self, val = None):
         self.open_puzzle(self._menu_pid)
@@ -658,7 +1058,7 @@ class DungeonCross:
         self.open_random_puzzle()
         self._menu_close()
     def _menu_reset(self):
-        self.open_puzzle(self.current_puzzle_id)
+        self.reset_puzzle()
         self._menu_close()
     def _menu_update_pid(self, value):
         try:
@@ -667,7 +1067,8 @@ class DungeonCross:
             self._menu_pid = 0
     def _menu_close(self):
         self._menu_is_open = False
-        self._menu.disable()
+        if self._menu is not None:
+            self._menu.disable()
         self.needs_display_update = True
     def _menu_set_mute(self, val: bool) -> None:
         self._sound.enabled = val
@@ -678,10 +1079,16 @@ class DungeonCross:
     def _menu_quit(self):
         pygame.event.post(pygame.event.Event(pygame.QUIT))
         self._menu_is_open = False
-        self._menu.disable()
+        if self._menu is not None:
+            self._menu.disable()
     def _menu_power_save(self, val: bool) -> None:
         self._power_save = val
+    def _menu_set_difficulty(self, item: tuple, val: int) -> None:
+        self._difficulty = val
+    def _menu_update_filter(self, value: str) -> None:
+        self._puzzle_filter = value
     def _menu_set_cb_mode(self, val: bool) -> None:
+        self._finish_loading()
         try:
             if val:
                 self._sprite_wall  = self._sprite_wall_cb
@@ -697,16 +1104,19 @@ class DungeonCross:
                 self._sprite_floor = self._sprite_floor_og
                 self._err_overlay = self._err_overlay_og
                 self._cb_mode = False
+            self._build_static_layer()
         except AttributeError as e:
             logging.warning(f"Error switching color modes: {e}")
-    def _menu_build_theme(self) -> pygame_menu.Theme:
+    def _menu_build_theme(self) -> "pygame_menu.Theme":
+        import pygame_menu
         pygame_menu.widgets.MENUBAR_STYLE_UNDERLINE_TITLE
         theme: pygame_menu.Theme = pygame_menu.themes.THEME_DARK.copy()
         theme.background_color = THEME_COLOR
         theme.widget_font_shadow = True
         theme.widget_font_size = 20
         return theme
-    def _menu_build_main(self) -> pygame_menu.Menu:
+    def _menu_build_main(self) -> "pygame_menu.Menu":
+        import pygame_menu
         menu: pygame_menu.Menu = pygame_menu.Menu(
             "Dungeon Cross", 
             400, 
@@ -717,10 +1127,28 @@ class DungeonCross:
         menu.add.button('Resume', action=self._menu_close)
         menu.add.button('Reset', action=self._menu_reset)
         menu.add.button("Random Puzzle", action=self._menu_random_map)
+        menu.add.selector(
+            "Difficulty: ",
+            [(name, i) for i, name in enumerate(DIFFICULTY_NAMES)],
+            default=self._difficulty,
+            onchange=self._menu_set_difficulty,
+            selector_id="DIFFICULTY"
+        )
+        menu.add.text_input(
+            'Filter: ',
+            default=self._puzzle_filter,
+            maxchar=40,
+            maxwidth=14,
+            valid_chars=[*'abcdefghijklmnopqrstuvwxyz_0123456789<>=! '],
+            onchange=self._menu_update_filter,
+            onreturn=lambda value: self._menu_random_map(),
+            background_color = (70, 50, 0),
+            textinput_id="FILTER"
+        )
         menu.add.vertical_fill(2)
         menu.add.text_input(
             'Puzzle ID: ',
-            default='0000000',
+            default=f"{max(0, self.current_puzzle_id):07d}",
             maxchar=7,
             valid_chars=[*'0123456789'],
             onchange=self._menu_update_pid,
@@ -733,20 +1161,20 @@ class DungeonCross:
         self._menu_sound_selector = menu.add.toggle_switch(
             "Sound: ",
             onchange=self._menu_set_mute, 
-            default=True,
+            default=self._sound.enabled,
             width=90,
             toggleswitch_id="SOUND"
         )
         self._menu_colorblind_selector = menu.add.toggle_switch(
             "Colorblind Mode: ",
             onchange=self._menu_set_cb_mode,
-            default=False,
+            default=self._cb_mode,
             width=90,
             toggleswitch_id="CB_MODE"
         )
         menu.add.toggle_switch(
             title="Power Saver: ",
-            default=False,
+            default=self._power_save,
             width=90,
             onchange=self._menu_power_save,
             toggleswitch_id="PW_SAVE"
@@ -756,13 +1184,20 @@ class DungeonCross:
         menu.add.button("About", self._menu_about)
         menu.add.button('Quit', self._menu_quit)
         return menu
-    def _menu_build_about(self):
+    def _menu_build_about(self) -> "pygame_menu.Menu":
+        import pygame_menu
         menu: pygame_menu.Menu = pygame_menu.Menu(
             "About", 
             700, 
             600,
             theme = self._menu_theme
         )
+        menu.set_onbeforeopen(self._menu_fill_about)
+        return menu
+    def _menu_fill_about(self, from_menu: "pygame_menu.Menu", menu: "pygame_menu.Menu") -> None:
+        import pygame_menu
+        if menu.get_widgets():      # only filled in the first time it's opened
+            return
         with open(resource_path("about.txt")) as f:
             lines = f.readlines()
         f.close()
@@ -770,14 +1205,20 @@ class DungeonCross:
         for line in lines:
             menu.add.label(line.splitlines()[0], align=pygame_menu.locals.ALIGN_LEFT)
         menu.add.image(resource_path("sprite/hydra3.png"))
-        return menu
-    def _menu_build_tutorial(self):
+    def _menu_build_tutorial(self) -> "pygame_menu.Menu":
+        import pygame_menu
         menu: pygame_menu.Menu = pygame_menu.Menu(
             "Tutorial", 
             700, 
             600,
             theme = self._menu_theme
         )
+        menu.set_onbeforeopen(self._menu_fill_tutorial)
+        return menu
+    def _menu_fill_tutorial(self, from_menu: "pygame_menu.Menu", menu: "pygame_menu.Menu") -> None:
+        import pygame_menu
+        if menu.get_widgets():      # only filled in the first time it's opened
+            return
         with open(resource_path("tutorial.txt")) as f:
             lines = f.readlines()
         f.close()
@@ -794,8 +1235,6 @@ class DungeonCross:
             else:
                 menu.add.label(line.splitlines()[0], align=pygame_menu.locals.ALIGN_LEFT)
         menu.add.image(resource_path("sprite/hydra3.png"))
-        return menu
-
 
 def show_splash(screen: pygame.Surface):
     """
@@ -814,13 +1253,39 @@ def show_splash(screen: pygame.Surface):
     pygame.display.update()
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=f"Dungeon Cross {VERSION}")
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="time the game loop, log the stats every 10 seconds, and toggle a stats overlay with F3"
+    )
+    parser.add_argument(
+        '--record',
+        metavar='FILE',
+        help="record this session's input to FILE, to be replayed with input_replay.py"
+    )
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help="time each startup phase and import, report them once the first frame is drawn, and exit"
+    )
+    args, _ = parser.parse_known_args()
+    return args
+
+
 def main():
+    startup_profile.mark("imports")
+    args = parse_args()
 
     # init logging
-    log_system.init_logging(G_LOG_LEVEL)
+    log_system.init_logging(G_LOG_LEVEL, VERSION)
+    profiler.PROFILER.enabled = args.profile
+    startup_profile.mark("init logging")
 
     # init pygame
     pygame.init()
+    startup_profile.mark("pygame.init")
 
     # create music handler object, load music, and start playback
     sound = sound_handler.SoundHandler(resource_path('audio/music/'))
@@ -828,30 +1293,54 @@ def main():
     sound.shuffle()
     sound.set_volume(35)
     sound.play_next_background_song()
+    startup_profile.mark("start music")
 
     # create display window
     screen = pygame.display.set_mode(G_RESOLUTION)
     pygame.display.set_caption(f"Dungeon Cross - {VERSION}")
     pygame.display.set_allow_screensaver = True
     show_splash(screen)
+    startup_profile.mark("open window and splash")
 
     # internal timer for FPS regulation
     clock = pygame.time.Clock()
 
     # create game and load levels
     game = DungeonCross(screen, sound)
-    game.load_puzzle_book('puzzles.json.gz')
+    startup_profile.mark("create game")
+    try:
+        game.load_puzzle_book('puzzles.bin')
+    except FileNotFoundError:
+        game.load_puzzle_book('puzzles.json.gz')
+    startup_profile.mark("load puzzle book")
+
+    # a recording replays without a play history or progress store, so don't
+    # use them while recording
+    if not args.record:
+        game.load_play_history()
+        game.load_progress_store()
     game.load_save()
+    startup_profile.mark("load save and open puzzle")
     game_run = True
+    recorder = None
+    if args.record:
+        import input_replay
+        recorder = input_replay.InputRecorder(args.record, game)
 
     # main loop
     logging.info("GAME START")
     while game_run:
         while game_run and not game.game_won:
 
-            # handle events
-            events = pygame.event.get()
+            # handle events. While idle, sleep until something happens
+            if game.is_idle:
+                events = [pygame.event.wait(IDLE_TIMEOUT_MS)] + pygame.event.get()
+            else:
+                events = pygame.event.get()
+            frame_start = time.perf_counter_ns()
             for event in events:
+                if recorder:
+                    recorder.record(event)
 
                 # handle window quit event
                 if event.type == pygame.QUIT:
@@ -874,12 +1363,31 @@ def main():
             # draw game assets
             game.update()
 
-            # update screen
-            pygame.display.update()
-            clock.tick(TARGET_FPS)
+            # update only the parts of the screen that were redrawn
+            rects = game.pop_update_rects()
+            if rects:
+                with profiler.section("display_update"):
+                    pygame.display.update(rects)
+            profiler.PROFILER.record("frame", time.perf_counter_ns() - frame_start)
+            profiler.PROFILER.maybe_dump()
+            if recorder:
+                recorder.next_frame()
+
+            # startup profiling ends at the first frame, without saving the game
+            if args.profile_startup:
+                startup_profile.mark("first frame")
+                startup_profile.uninstall()
+                for line in startup_profile.report():
+                    print(line)
+                    logging.info(line)
+                game_run = False
+            clock.tick(game.target_fps)
         if game.game_won:
             time.sleep(2)
             game.open_random_puzzle()
+    if recorder:
+        recorder.close()
+    profiler.PROFILER.dump()
 
 if __name__ == '__main__':
     main()
@@ -5,6 +5,8 @@ block_cipher = None
 
 added_files = [
 	('sprite/*', 'sprite'),
+    ('puzzles.bin', '.'),
+    ('puzzles.bin.npz', '.'),
     ('puzzles.json.gz', '.'),
     ('tutorial.txt', '.'),
     ('about.txt', '.'),
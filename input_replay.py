@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Input recordings (all values little-endian):
+#
+#    header:  magic "DCIR", u16 version, u32 random seed, u32 starting puzzle ID,
+#             u64 starting walls, u64 starting marks, u8 difficulty,
+#             u16 puzzle filter length, then the filter as UTF-8 (version 2)
+#    events:  u32 frame, u8 event code, u16 x (key mods for key events),
+#             u16 y, u32 data (button, button mask or key)
+#    footer:  u32 final puzzle ID, u64 final walls, u64 final marks, u8 game won,
+#             u32 puzzles won during the session
+#
+#  Board masks use the bitboard layout. The game's random module is seeded
+#  from the header and the difficulty and puzzle filter are restored from it,
+#  so random puzzles open the same way when replayed. Version 1 recordings
+#  have neither setting, they replay with no difficulty or filter set. Input
+#  inside the menu is handled by pygame_menu and isn't recorded, so sessions
+#  that load puzzles from the menu won't replay to the same state.
+
+import os
+import sys
+import struct
+import random
+import logging
+import argparse
+from time import perf_counter_ns
+from collections import namedtuple
+import pygame
+import profiler
+
+REPLAY_MAGIC = b"DCIR"
+REPLAY_VERSION = 2
+
+_HEADER = struct.Struct("<4sHIIQQ")
+_SETTINGS = struct.Struct("<BH")
+_EVENT = struct.Struct("<IBHHI")
+_FOOTER = struct.Struct("<IQQBI")
+
+# event codes stored in recordings
+_EVENT_CODES = {
+    pygame.MOUSEBUTTONDOWN: 1,
+    pygame.MOUSEBUTTONUP: 2,
+    pygame.MOUSEMOTION: 3,
+    pygame.KEYDOWN: 4,
+}
+_EVENT_TYPES = {code: event_type for event_type, code in _EVENT_CODES.items()}
+
+# A loaded recording. events is a list of (frame, pygame.event.Event).
+Recording = namedtuple("Recording", ['seed', 'puzzle_id', 'walls', 'marks', 'difficulty', 'puzzle_filter',
+                                     'events', 'final'])
+FinalState = namedtuple("FinalState", ['puzzle_id', 'walls', 'marks', 'game_won', 'wins'])
+
+
+def _pack_event(frame: int, event: pygame.event.Event) -> bytes:
+    code = _EVENT_CODES[event.type]
+    if event.type == pygame.KEYDOWN:
+        return _EVENT.pack(frame, code, event.mod & 0xFFFF, 0, event.key)
+    x, y = event.pos
+    if event.type == pygame.MOUSEMOTION:
+        data = sum(bool(pressed) << i for i, pressed in enumerate(event.buttons[:3]))
+    else:
+        data = event.button
+    return _EVENT.pack(frame, code, max(0, x), max(0, y), data)
+
+def _unpack_event(buffer, offset: int) -> tuple:
+    frame, code, x, y, data = _EVENT.unpack_from(buffer, offset)
+    event_type = _EVENT_TYPES[code]
+    if event_type == pygame.KEYDOWN:
+        event = pygame.event.Event(event_type, key=data, mod=x)
+    elif event_type == pygame.MOUSEMOTION:
+        buttons = tuple(int(bool(data >> i & 1)) for i in range(3))
+        event = pygame.event.Event(event_type, pos=(x, y), buttons=buttons)
+    else:
+        event = pygame.event.Event(event_type, pos=(x, y), button=data)
+    return frame, event
+
+def _game_state(game, start_wins: int) -> FinalState:
+    board = game._placed_walls
+    return FinalState(game.current_puzzle_id, board.walls, board.marks, game.game_won,
+                      game._player_wins - start_wins)
+
+
+class InputRecorder:
+    """
+    Records the game's input events to a file. Create it once the starting
+    puzzle is open, pass it every event the game handles, call next_frame()
+    once per main loop iteration and close() when the session ends.
+    """
+
+    def __init__(self, file_name: str, game):
+        self._game = game
+        self._frame = 0
+        self.count = 0
+        self._start_wins = game._player_wins
+        seed = random.getrandbits(32)
+        random.seed(seed)
+        state = _game_state(game, self._start_wins)
+        puzzle_filter = game._puzzle_filter.encode('utf-8')
+        self._file = open(file_name, 'wb')
+        self._file.write(_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed, state.puzzle_id, state.walls, state.marks))
+        self._file.write(_SETTINGS.pack(game._difficulty, len(puzzle_filter)) + puzzle_filter)
+        logging.info(f"Recording input to {file_name}.")
+
+    def record(self, event: pygame.event.Event) -> None:
+        """Records an event. Event types the game doesn't replay are ignored."""
+        if event.type in _EVENT_CODES:
+            self._file.write(_pack_event(self._frame, event))
+            self.count += 1
+
+    def next_frame(self) -> None:
+        self._frame += 1
+
+    def close(self) -> None:
+        """Writes the final game state and closes the file."""
+        if self._file.closed:
+            return
+        self._file.write(_FOOTER.pack(*_game_state(self._game, self._start_wins)))
+        self._file.close()
+        logging.info(f"Recorded {self.count} events over {self._frame} frames.")
+
+
+def load_recording(file_name: str) -> Recording:
+    """Reads a recording written by InputRecorder."""
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size + _FOOTER.size:
+        raise ValueError(f"{file_name} is too short to be an input recording")
+    magic, version, seed, puzzle_id, walls, marks = _HEADER.unpack_from(data, 0)
+    if magic != REPLAY_MAGIC:
+        raise ValueError(f"{file_name} is not an input recording")
+    if version > REPLAY_VERSION:
+        raise ValueError(f"Unsupported input recording version {version} in {file_name}")
+    start = _HEADER.size
+    difficulty, puzzle_filter = 0, ""
+    if version >= 2:
+        if len(data) < start + _SETTINGS.size + _FOOTER.size:
+            raise ValueError(f"Input recording {file_name} is truncated")
+        difficulty, length = _SETTINGS.unpack_from(data, start)
+        start += _SETTINGS.size
+        puzzle_filter = data[start:start + length].decode('utf-8')
+        start += length
+    end = len(data) - _FOOTER.size
+    if end < start or (end - start) % _EVENT.size:
+        raise ValueError(f"Input recording {file_name} is truncated")
+    events = [_unpack_event(data, offset) for offset in range(start, end, _EVENT.size)]
+    final = FinalState(*_FOOTER.unpack_from(data, end))
+    return Recording(seed, puzzle_id, walls, marks, difficulty, puzzle_filter, events,
+                     final._replace(game_won=bool(final.game_won)))
+
+def replay(game, recording: Recording) -> dict:
+    """
+    Feeds a recording through the game as fast as possible, the same way the
+    main loop would: each frame's events go to handle_io_event, then update()
+    runs, and a won puzzle is followed by a random one. If the menu gets opened
+    it is closed again, since the menu input wasn't recorded. Raises AssertionError
+    if the game doesn't end in the recorded state. Returns timing stats.
+    """
+
+    from bitboard import Bitboard
+    game._difficulty = recording.difficulty
+    game._puzzle_filter = recording.puzzle_filter
+    random.seed(recording.seed)
+    game.open_puzzle(recording.puzzle_id)
+    game._placed_walls = Bitboard(recording.walls, recording.marks,
+                                  game._board_layout.enemies, game._board_layout.chests)
+    game._update_hint_vars()
+    start_wins = game._player_wins
+    game.update()
+    game.pop_update_rects()
+
+    frames = profiler.Profiler(window=max(1, len(recording.events)))
+    frames.enabled = True
+    events = recording.events
+    i = 0
+    start = perf_counter_ns()
+    while i < len(events):
+        frame_start = perf_counter_ns()
+        frame = events[i][0]
+        while i < len(events) and events[i][0] == frame:
+            game.handle_io_event(events[i][1])
+            i += 1
+        if game._menu_is_open:
+            game._menu_close()
+        game.update()
+        game.pop_update_rects()
+        if game.game_won:
+            game.open_random_puzzle()
+        frames.record("frame", perf_counter_ns() - frame_start)
+    seconds = (perf_counter_ns() - start) / 1e9
+
+    state = _game_state(game, start_wins)
+    assert state == recording.final, f"Replay ended in {state}, expected {recording.final}"
+    stats = frames.stats().get("frame", {})
+    return {
+        "events": len(events),
+        "frames": stats.get("count", 0),
+        "seconds": seconds,
+        "events_per_s": len(events) / seconds if seconds else 0.0,
+        "frame_us": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a recorded Dungeon Cross session headless.")
+    parser.add_argument("file", help="Recording made with dungeon_cross.py --record.")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="Number of times to replay it.")
+    parser.add_argument("--book", default="puzzles.bin", help="Puzzle book the session was played with.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import dungeon_cross
+    import sound_handler
+
+    recording = load_recording(args.file)
+    pygame.init()
+    screen = pygame.display.set_mode(dungeon_cross.G_RESOLUTION)
+    sound = sound_handler.SoundHandler(dungeon_cross.resource_path('audio/music/'))
+    game = dungeon_cross.DungeonCross(screen, sound)
+    sound.enabled = False
+    game.load_puzzle_book(args.book)
+    for run in range(args.repeat):
+        try:
+            stats = replay(game, recording)
+        except AssertionError as e:
+            print(f"Replay {run + 1} FAILED: {e}")
+            return 1
+        frame = stats["frame_us"]
+        print(f"Replay {run + 1}: {stats['events']} events, {stats['frames']} frames in "
+              f"{stats['seconds']:.3f}s ({stats['events_per_s']:.0f} events/s). Frame time "
+              f"p50 {frame.get('p50', 0):.1f}us, p95 {frame.get('p95', 0):.1f}us, p99 {frame.get('p99', 0):.1f}us.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,11 +4,10 @@ import time
 import logging
 import traceback
 import platform
-from dungeon_cross import VERSION
 
-def log_sys_info() -> None:
+def log_sys_info(version: str = "") -> None:
     """Logs basic system info."""
-    logging.info(f"Build: {VERSION}")
+    logging.info(f"Build: {version}")
     logging.info(time.ctime())
     logging.info(platform.platform())
     logging.info(f"Python Version: {platform.python_version()}")
@@ -19,11 +18,12 @@ def exception_handler_hook(ex_type, ex_val, ex_tb):
     logging.critical("Unhandled exception: ", exc_info = (ex_type, ex_val, ex_tb))
     print(''.join(traceback.format_exception(ex_type, ex_val, ex_tb)))
 
-def init_logging(log_level: int = logging.INFO):
+def init_logging(log_level: int = logging.INFO, version: str = ""):
     """
     Wraps the logging module startup. Handles the correct log
     directory path based on the OS platform and whether or not
-    the program is a compiled executable or not. 
+    the program is a compiled executable or not. The program
+    version is written to the top of the log.
     """
 
     lfmt = "%(levelname)s [%(funcName)s]: %(message)s"
@@ -50,4 +50,4 @@ def init_logging(log_level: int = logging.INFO):
         logging.error(e)
     sys.excepthook = exception_handler_hook
     logging.info("LOG START")
-    log_sys_info()
\ No newline at end of file
+    log_sys_info(version)
\ No newline at end of file
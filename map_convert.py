@@ -24,9 +24,13 @@ import gzip
 import numpy
 import random
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from map_object_enum import MapObject
+from puzzle_book import PuzzleBookWriter
+from puzzle_index import build_book_index, index_path, write_index
 
 VERSION = "v1.1.0"
+SHARD_SIZE = 4096
 
 def to_bit_list(byte):
     out = []
@@ -143,40 +147,182 @@ def place_chest(map_list: list):
                 exit(1)
     return map_list
 
-def get_rot_maps(map_list: list) -> list:
+def unpack_mapcodes(lines: list) -> numpy.ndarray:
     """
-    Returns copies of the maps rotated by 90-degree intervals.
-    Does not return original maps.
+    Unpacks a list of mapcode strings into a single (N, 8, 8) uint8 array of walls.
+    Same layout as convert_str_to_map: row 0 is the most significant byte.
     """
 
-    print("Generating rotated maps", end="")
-    out_list = []
-    for i, m in enumerate(map_list):
-        mp: numpy.ndarray = numpy.array(m)
-        for _ in range(0, 3):
-            mp = numpy.rot90(mp)
-            out_list.append(mp.tolist())
-        if i % 1000 == 0:
-            print(".", end="", flush=True)
-    print("Done.")
-    return out_list
+    codes = numpy.array([int(line) for line in lines], dtype='>u8')
+    rows = codes.view(numpy.uint8).reshape(-1, 8)
+    return numpy.unpackbits(rows, axis=1, bitorder='little').reshape(-1, 8, 8)
 
-def get_flip_maps(map_list: list) -> list:
+def place_enemies_batch(maps: numpy.ndarray) -> numpy.ndarray:
     """
-    Returns list of flippled maps
-    Does not return original maps.
+    Batched place_enemies. Counts the walls around every cell of every map
+    at once, with the border padded as walls, and places an enemy in every
+    empty cell that has exactly three walls around it.
     """
 
-    print("Generating flipped maps", end="")
-    out_list = []
-    for i, m in enumerate(map_list):
-        mp: numpy.ndarray = numpy.array(m)
-        mp = numpy.flip(mp)
-        out_list.append(mp.tolist())
-        if i % 1000 == 0:
-            print(".", end="", flush=True)
-    print("Done.")
-    return out_list
+    walls = (maps == MapObject.WALL.value)
+    padded = numpy.pad(walls, ((0, 0), (1, 1), (1, 1)), constant_values=True).astype(numpy.uint8)
+    neighbors = padded[:, :-2, 1:-1] + padded[:, 2:, 1:-1] + padded[:, 1:-1, :-2] + padded[:, 1:-1, 2:]
+    maps[~walls & (neighbors == 3)] = MapObject.ENEMY.value
+    return maps
+
+def place_chest_batch(maps: numpy.ndarray, rng: numpy.random.Generator) -> numpy.ndarray:
+    """
+    Batched place_chest. Finds every empty 3x3 room of every map with a sliding 
+    window, then walks the 36 room positions in the same order as place_chest,
+    placing a chest at a random position in each room that is still empty.
+    """
+
+    empty = (maps == MapObject.EMPTY.value)
+    windows = numpy.lib.stride_tricks.sliding_window_view(empty, (3, 3), axis=(1, 2))
+    rooms = windows.all(axis=(3, 4))
+    for y in range(6):
+        for x in range(6):
+            idx = numpy.flatnonzero(rooms[:, y, x])
+            if len(idx) == 0:
+                continue
+
+            # a chest placed in an earlier overlapping room fills this one
+            idx = idx[empty[idx, y:y + 3, x:x + 3].all(axis=(1, 2))]
+            offsets = rng.integers(0, 3, size=(len(idx), 2))
+            cy = y + offsets[:, 1]
+            cx = x + offsets[:, 0]
+            maps[idx, cy, cx] = MapObject.CHEST.value
+            empty[idx, cy, cx] = False
+    return maps
+
+def convert_maps_batch(lines: list, seed=0) -> numpy.ndarray:
+    """
+    Builds every map in lines at once. The seed may be an int or a SeedSequence,
+    the same seed always gives the same maps.
+    """
+    rng = numpy.random.default_rng(seed)
+    maps = unpack_mapcodes(lines)
+    maps = place_enemies_batch(maps)
+    maps = place_chest_batch(maps, rng)
+    return maps
+
+def build_shard(shard: tuple) -> numpy.ndarray:
+    """Worker entry point. Builds one (lines, seed) shard of the corpus."""
+    lines, seed = shard
+    return convert_maps_batch(lines, seed)
+
+def iter_built_maps(lines: list, seed: int = 0, jobs: int = 1):
+    """
+    Splits lines into shards of SHARD_SIZE maps and yields the built (N, 8, 8)
+    array of each shard, in order. Every shard gets its own seed derived from
+    seed and the shard number, so the output doesn't depend on the job count.
+    """
+
+    shards = (
+        (lines[i:i + SHARD_SIZE], numpy.random.SeedSequence(seed, spawn_key=(i // SHARD_SIZE,)))
+        for i in range(0, len(lines), SHARD_SIZE)
+    )
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(build_shard, shards)
+    else:
+        yield from map(build_shard, shards)
+
+def pack_maps(maps: numpy.ndarray) -> bytes:
+    """Packs an (N, 8, 8) map array into puzzle book records (three u64 masks per map)."""
+    masks = numpy.empty((len(maps), 3), dtype='<u8')
+    for i, obj in enumerate((MapObject.WALL, MapObject.ENEMY, MapObject.CHEST)):
+        rows = numpy.packbits(maps == obj.value, axis=2, bitorder='little').reshape(-1, 8)
+        masks[:, i] = rows.view('>u8').reshape(-1)
+    return masks.tobytes()
+
+def iter_rot_maps(chunks):
+    """
+    Yields rotated copies of each chunk of maps, each map rotated by 90-degree 
+    intervals. Does not yield original maps.
+    """
+
+    for maps in chunks:
+        rotated = numpy.stack([numpy.rot90(maps, k, axes=(1, 2)) for k in range(1, 4)], axis=1)
+        yield rotated.reshape(-1, 8, 8)
+
+def iter_flip_maps(chunks):
+    """
+    Yields copies of each chunk of maps mirrored left to right, the flip of
+    bitboard.transform_index. Does not yield original maps.
+    """
+
+    for maps in chunks:
+        yield numpy.flip(maps, axis=2)
+
+def get_symmetries(maps: numpy.ndarray) -> numpy.ndarray:
+    """
+    Returns an (8, N, 8, 8) array of every symmetry of each map, in the same order
+    as bitboard.transform_index: four counter-clockwise rotations, then the same 
+    four mirrored left to right.
+    """
+
+    rotated = [numpy.rot90(maps, k, axes=(1, 2)) for k in range(4)]
+    return numpy.stack(rotated + [numpy.flip(m, axis=2) for m in rotated])
+
+def canonicalize_maps(maps: numpy.ndarray) -> numpy.ndarray:
+    """
+    Returns the canonical form of each map: whichever of its 8 symmetries
+    has the smallest (walls, enemies, chests) masks.
+    """
+
+    syms = get_symmetries(maps)
+    keys = numpy.frombuffer(pack_maps(syms.reshape(-1, 8, 8)), dtype='<u8').reshape(8, -1, 3)
+    best = numpy.zeros(len(maps), dtype=numpy.intp)
+    best_key = keys[0].copy()
+    for t in range(1, 8):
+        key = keys[t]
+        smaller = key[:, 0] < best_key[:, 0]
+        tie = key[:, 0] == best_key[:, 0]
+        smaller |= tie & (key[:, 1] < best_key[:, 1])
+        tie &= key[:, 1] == best_key[:, 1]
+        smaller |= tie & (key[:, 2] < best_key[:, 2])
+        best[smaller] = t
+        best_key[smaller] = key[smaller]
+    return syms[best, numpy.arange(len(maps))]
+
+def iter_canonical_maps(chunks, stats: dict = None):
+    """
+    Yields chunks of maps in canonical form with duplicates removed. Maps with 
+    the same walls under any symmetry are duplicates; the first one is kept.
+    If stats is given, the number of duplicates dropped is stored in it.
+    """
+
+    seen = set()
+    dropped = 0
+    for maps in chunks:
+        maps = canonicalize_maps(maps)
+        walls = numpy.packbits(maps == MapObject.WALL.value, axis=2, bitorder='little').reshape(-1, 8)
+        keep = []
+        for i, key in enumerate(walls.view('>u8').reshape(-1).tolist()):
+            if key not in seen:
+                seen.add(key)
+                keep.append(i)
+        dropped += len(maps) - len(keep)
+        if stats is not None:
+            stats['duplicates'] = dropped
+        yield maps[keep]
+
+def iter_output_maps(source, rotate: bool = False, flip: bool = False):
+    """
+    Yields every chunk of maps that goes in the book: the original maps, then 
+    their rotations, then flipped copies of both. source is called once per
+    pass and must return a fresh iterator over the original chunks, so nothing
+    bigger than a chunk is ever held in memory.
+    """
+
+    passes = [source]
+    if rotate:
+        passes.append(lambda: iter_rot_maps(source()))
+    if flip:
+        passes += [lambda p=p: iter_flip_maps(p()) for p in list(passes)]
+    for p in passes:
+        yield from p()
 
 def convert_map(map_list: list) -> list:
     _map = convert_str_to_map(map_list)
@@ -184,6 +330,42 @@ def convert_map(map_list: list) -> list:
     _map = place_chest(_map)
     return _map
 
+def load_json_book(file_name: str) -> list:
+    """Loads the maps from an existing gzipped JSON puzzle book."""
+    with gzip.open(file_name, 'r') as f:
+        return json.load(f)
+
+def write_json_book(file_name: str, chunks) -> int:
+    """
+    Writes chunks of maps to a gzipped JSON puzzle book. Maps are encoded
+    one at a time straight into the gzip stream. Returns the number of maps written.
+    """
+
+    count = 0
+    with gzip.open(file_name, "wt", encoding='utf-8') as f:
+        f.write('[')
+        for maps in chunks:
+            for mp in maps.tolist():
+                if count:
+                    f.write(',')
+                f.write(json.dumps(mp, separators=(',', ':')))
+                count += 1
+        f.write(']')
+    return count
+
+def write_bin_book(file_name: str, chunks) -> int:
+    """Writes chunks of maps to a binary puzzle book. Returns the number of maps written."""
+    with PuzzleBookWriter(file_name) as writer:
+        for maps in chunks:
+            writer.write_packed(pack_maps(maps))
+    return writer.count
+
+def print_progress(chunks):
+    """Passes chunks through, printing a dot for each one."""
+    for maps in chunks:
+        print('.', end='', flush=True)
+        yield maps
+
 def main():
     print(f"Map Converter {VERSION}")
 
@@ -191,37 +373,51 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-r", action="store_true", help="Include rotated maps.")
     parser.add_argument("-f", action="store_true", help="Include flipped maps.")
-    parser.add_argument("file", type=argparse.FileType('r'))
+    parser.add_argument("--format", choices=["bin", "json"], default="bin", help="Output puzzle book format.")
+    parser.add_argument("--from-json", action="store_true", help="Input file is an existing JSON puzzle book, not mapcodes.")
+    parser.add_argument("-o", "--output", help="Output file name.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for chest placement.")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("-c", "--canonical", action="store_true", 
+                        help="Store each map once, in canonical form. The game applies rotations/flips from the puzzle ID.")
+    parser.add_argument("--no-index", action="store_true", help="Don't write the feature index (see puzzle_index.py) next to the book.")
+    parser.add_argument("file")
     args = parser.parse_args()
-
-    # retrieve all the raw mask codes 
-    print("Building maps", end='',flush=True)
-    with args.file as f:
-        lines = f.read().splitlines()
-    f.close()
-
-    # start building the maps (walls, monsters, chests)
-    out_list = []
-    for i, line in enumerate(lines):
-        out_list.append(convert_map(line))
-        if i % 1000 == 0:
-            print('.', end='', flush=True)
-    print("Done.")
-
-    # if rotation option is selected, call the rotation function and merge the returned list
-    if args.r:
-        out_list = out_list + get_rot_maps(out_list)
-
-    # if flip option is selected, call the flip function and merge the returned list
-    if args.f:
-        out_list = out_list + get_flip_maps(out_list)
-
-    # finally, write output to a compressed file
-    print(f"Writing {len(out_list)} maps to file, this might take a while...")
-    with gzip.open("puzzles.json.gz", "w") as f:
-        f.write(bytes(json.dumps(out_list, separators=(',', ':')), 'utf-8'))
-    f.close()
-    print("Done.")
+    if args.canonical and (args.r or args.f):
+        parser.error("-c can't be combined with -r or -f, canonical books store a single orientation of each map.")
+    out_file = args.output or ("puzzles.bin" if args.format == "bin" else "puzzles.json.gz")
+
+    if args.from_json:
+        print(f"Reading maps from {args.file}...", end='', flush=True)
+        book = numpy.array(load_json_book(args.file), dtype=numpy.uint8).reshape(-1, 8, 8)
+        source = lambda: (book[i:i + SHARD_SIZE] for i in range(0, len(book), SHARD_SIZE))
+        print("Done.")
+    else:
+
+        # retrieve all the raw mask codes. The maps themselves (walls, monsters, chests)
+        # are built shard by shard, again for each rotate/flip pass, as they are written
+        with open(args.file, 'r') as f:
+            lines = f.read().splitlines()
+        f.close()
+        source = lambda: iter_built_maps(lines, args.seed, args.jobs)
+
+    # build and write output, one chunk of maps at a time
+    print(f"Writing maps to {out_file}", end='', flush=True)
+    stats = {'duplicates': 0}
+    chunks = iter_output_maps(source, args.r, args.f)
+    if args.canonical:
+        chunks = iter_canonical_maps(chunks, stats)
+    chunks = print_progress(chunks)
+    if args.format == "bin":
+        count = write_bin_book(out_file, chunks)
+    else:
+        count = write_json_book(out_file, chunks)
+    print(f"Done.\nWrote {count} maps to {out_file}.")
+    if args.canonical:
+        print(f"Dropped {stats['duplicates']} duplicate maps.")
+    if not args.no_index:
+        write_index(index_path(out_file), build_book_index(out_file))
+        print(f"Wrote feature index to {index_path(out_file)}.")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
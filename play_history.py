@@ -0,0 +1,194 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Play history file format (all values little-endian):
+#
+#    header:  magic "DCPH", u16 version, u16 reserved, u32 puzzle count,
+#             u64 book key
+#    bitset:  one byte per puzzle, bit t is set once the puzzle has been won
+#             with symmetry t (see bitboard.transform_index)
+#
+#  Random unplayed puzzles are picked with rank/select. The bitset is split
+#  into blocks of BLOCK_SIZE puzzles and a Fenwick tree of unplayed counts per
+#  block is built when the file is opened. Picking the r-th unplayed pair walks
+#  down the tree to its block, then counts through that block's bytes, so a
+#  pick costs the same however much of the book has been played.
+
+import os
+import mmap
+import random
+import struct
+import logging
+from bitboard import popcount
+
+HISTORY_MAGIC = b"DCPH"
+HISTORY_VERSION = 1
+BLOCK_SIZE = 64
+
+_HEADER = struct.Struct("<4sHHIQ")
+
+
+class PlayHistory:
+    """
+    Memory-mapped record of every (puzzle, symmetry) pair the player has won.
+    The history belongs to one puzzle book, it starts over if the book changes.
+    """
+
+    def __init__(self, file_name: str, count: int, book_key: int):
+        self._count = count
+        self._file = None
+        self._map = None
+        if not self._open(file_name, book_key):
+            logging.info(f"Starting a new play history: {file_name}")
+            self._create(file_name, book_key)
+        self._build_tree()
+        logging.info(f"Play history: {len(self)} of {count * 8} puzzles won.")
+
+    def __len__(self) -> int:
+        """Number of (puzzle, symmetry) pairs won."""
+        return self._count * 8 - self._unplayed
+
+    @property
+    def unplayed(self) -> int:
+        return self._unplayed
+
+    def is_played(self, num: int, t: int) -> bool:
+        return bool(self._map[_HEADER.size + num] >> t & 1)
+
+    def mark(self, num: int, t: int) -> None:
+        """Marks puzzle num, shown with symmetry t, as won and writes it out."""
+        offset = _HEADER.size + num
+        byte = self._map[offset]
+        if byte >> t & 1:
+            return
+        self._map[offset] = byte | (1 << t)
+        self._unplayed -= 1
+        i = num // BLOCK_SIZE + 1
+        while i < len(self._tree):
+            self._tree[i] -= 1
+            i += i & -i
+        self._map.flush()
+
+    def random_unplayed(self, exclude: int = -1):
+        """
+        Returns the (puzzle number, symmetry) of a random pair that hasn't been
+        won, avoiding puzzle exclude if anything else is left. Returns None if
+        everything has been won.
+        """
+
+        if self._unplayed == 0:
+            return None
+        excluded = 0
+        if 0 <= exclude < self._count:
+            excluded = 8 - popcount(self._map[_HEADER.size + exclude])
+            if excluded == self._unplayed:
+                excluded = 0
+        r = random.randrange(self._unplayed - excluded)
+        num, t = self._select(r)
+
+        # the excluded puzzle's pairs are next to each other, skip over them
+        if excluded and num >= exclude:
+            num, t = self._select(r + excluded)
+        return num, t
+
+    def unplayed_symmetry(self, num: int) -> int:
+        """Returns a random symmetry puzzle num hasn't been won with, -1 if it's been won with all 8."""
+        byte = self._map[_HEADER.size + num]
+        free = [t for t in range(8) if not byte >> t & 1]
+        return random.choice(free) if free else -1
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _build_tree(self) -> None:
+        """Builds the Fenwick tree of unplayed pairs per block."""
+        blocks = (self._count + BLOCK_SIZE - 1) // BLOCK_SIZE
+        tree = [0] * (blocks + 1)
+        for b in range(blocks):
+            first = _HEADER.size + b * BLOCK_SIZE
+            last = min(first + BLOCK_SIZE, _HEADER.size + self._count)
+            tree[b + 1] = (last - first) * 8 - popcount(int.from_bytes(self._map[first:last], 'little'))
+        self._unplayed = sum(tree)
+        for i in range(1, blocks + 1):
+            parent = i + (i & -i)
+            if parent <= blocks:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._top = 1 << (blocks.bit_length() - 1) if blocks else 0
+
+    def _select(self, r: int) -> tuple:
+        """Returns the (puzzle number, symmetry) of the r-th unplayed pair, counting from 0."""
+
+        # find the block holding it
+        block, step = 0, self._top
+        while step:
+            i = block + step
+            if i < len(self._tree) and self._tree[i] <= r:
+                block = i
+                r -= self._tree[i]
+            step >>= 1
+
+        # then the puzzle and symmetry inside the block
+        num = block * BLOCK_SIZE
+        while True:
+            free = 8 - popcount(self._map[_HEADER.size + num])
+            if r < free:
+                break
+            r -= free
+            num += 1
+        byte = self._map[_HEADER.size + num]
+        for t in range(8):
+            if not byte >> t & 1:
+                if r == 0:
+                    return num, t
+                r -= 1
+
+    def _open(self, file_name: str, book_key: int) -> bool:
+        """Maps an existing history file. Returns False if there's none, or it's for another book."""
+        try:
+            self._file = open(file_name, 'r+b')
+        except FileNotFoundError:
+            return False
+        try:
+            header = self._file.read(_HEADER.size)
+            if len(header) == _HEADER.size and os.fstat(self._file.fileno()).st_size == _HEADER.size + self._count:
+                magic, version, _, count, key = _HEADER.unpack(header)
+                if magic == HISTORY_MAGIC and version == HISTORY_VERSION and count == self._count and key == book_key:
+                    self._map = mmap.mmap(self._file.fileno(), 0)
+                    return True
+            logging.warning(f"Play history {file_name} doesn't match the puzzle book.")
+        except OSError as e:
+            logging.warning(f"Couldn't read play history {file_name}: {e}")
+        self._file.close()
+        self._file = None
+        return False
+
+    def _create(self, file_name: str, book_key: int) -> None:
+        """Writes an empty history file and maps it."""
+        with open(file_name, 'wb') as f:
+            f.write(_HEADER.pack(HISTORY_MAGIC, HISTORY_VERSION, 0, self._count, book_key))
+            f.write(bytes(self._count))
+        self._file = open(file_name, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
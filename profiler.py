@@ -0,0 +1,142 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Lightweight frame-time profiler. Sections are timed with perf_counter_ns
+#  and the most recent samples of each are kept, so percentiles reflect
+#  current behaviour rather than startup. Profiling is off by default, and
+#  while it's off the timing wrappers only cost an attribute check.
+
+import logging
+import functools
+from time import perf_counter_ns
+from collections import deque
+from typing import Callable
+
+PERCENTILES = (50, 95, 99)
+
+class _Section:
+    """Context manager that records the time spent inside it to a profiler section."""
+
+    __slots__ = ("_profiler", "_name", "_start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self._profiler = profiler
+        self._name = name
+        self._start = 0
+
+    def __enter__(self) -> "_Section":
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._profiler.record(self._name, perf_counter_ns() - self._start)
+
+
+class Profiler:
+    """
+    Collects timings for named sections. Use section() as a context manager or
+    profile() as a decorator. Stats are reported in microseconds.
+    """
+
+    def __init__(self, window: int = 2048, dump_interval: float = 10.0):
+        self.enabled = False
+        self._window = window
+        self._samples: dict = {}
+        self._counts: dict = {}
+        self._dump_interval_ns = int(dump_interval * 1e9)
+        self._last_dump = perf_counter_ns()
+
+    def section(self, name: str) -> _Section:
+        """Returns a context manager timing the code inside it as section name."""
+        return _Section(self, name)
+
+    def profile(self, name: str = None) -> Callable:
+        """Decorator timing every call of a function as section name (default: function name)."""
+        def decorator(func: Callable) -> Callable:
+            section_name = name or func.__name__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(section_name, perf_counter_ns() - start)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, elapsed_ns: int) -> None:
+        """Adds one sample, in nanoseconds, to a section."""
+        if not self.enabled:
+            return
+        try:
+            self._samples[name].append(elapsed_ns)
+            self._counts[name] += 1
+        except KeyError:
+            self._samples[name] = deque([elapsed_ns], maxlen=self._window)
+            self._counts[name] = 1
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._counts.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns {section: {"count", "mean", "p50", "p95", "p99", "max"}} over the
+        most recent samples of each section. count is the total number of calls.
+        """
+
+        out = {}
+        for name, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            entry = {"count": self._counts[name], "mean": sum(ordered) / n / 1000}
+            for p in PERCENTILES:
+                entry[f"p{p}"] = ordered[min(n - 1, (n * p) // 100)] / 1000
+            entry["max"] = ordered[-1] / 1000
+            out[name] = entry
+        return out
+
+    def format_stats(self) -> list:
+        """Returns the stats as lines of text, one per section."""
+        lines = []
+        for name, s in sorted(self.stats().items()):
+            lines.append(f"{name:<16} n={s['count']:<7} p50={s['p50']:9.1f}us "
+                         f"p95={s['p95']:9.1f}us p99={s['p99']:9.1f}us")
+        return lines
+
+    def dump(self) -> None:
+        """Writes the current stats to the log."""
+        if not self.enabled:
+            return
+        self._last_dump = perf_counter_ns()
+        for line in self.format_stats():
+            logging.info(f"PROFILE: {line}")
+
+    def maybe_dump(self) -> None:
+        """Dumps the stats to the log if the dump interval has passed. Call once per frame."""
+        if self.enabled and perf_counter_ns() - self._last_dump >= self._dump_interval_ns:
+            self.dump()
+
+
+# shared profiler used by the game
+PROFILER = Profiler()
+profile = PROFILER.profile
+section = PROFILER.section
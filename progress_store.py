@@ -0,0 +1,101 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Progress of every puzzle the player has started, in an SQLite database with
+#  one row per board, keyed by fingerprint (see puzzle_book.py). Since the
+#  fingerprint identifies the board on screen, progress follows a puzzle even
+#  if the puzzle book is rebuilt and its ID changes. Each row holds the placed
+#  walls and marks as two 64-bit masks, the puzzle ID it was last opened as
+#  and when it was last saved.
+#
+#  SQLite integers are signed, so fingerprints and masks are stored as their
+#  two's complement value and converted back when read. Database errors are
+#  logged and otherwise ignored, losing progress shouldn't stop the game.
+
+import time
+import sqlite3
+import logging
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    fingerprint INTEGER PRIMARY KEY,
+    walls INTEGER NOT NULL,
+    marks INTEGER NOT NULL,
+    puzzle_id INTEGER NOT NULL,
+    saved REAL NOT NULL
+)
+"""
+
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class ProgressStore:
+    """Saved walls and marks of any number of puzzles, looked up by fingerprint."""
+
+    def __init__(self, file_name: str):
+        self._db = sqlite3.connect(file_name)
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        logging.info(f"Progress store {file_name}: {len(self)} puzzles in progress.")
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM progress").fetchone()[0]
+
+    def get(self, fingerprint: int):
+        """Returns the saved (walls, marks) masks of a board, or None if it has none."""
+        try:
+            row = self._db.execute(
+                "SELECT walls, marks FROM progress WHERE fingerprint = ?", (_to_signed(fingerprint),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Could not read puzzle progress: {e}")
+            return None
+        if row is None:
+            return None
+        return _to_unsigned(row[0]), _to_unsigned(row[1])
+
+    def put(self, fingerprint: int, walls: int, marks: int, puzzle_id: int) -> None:
+        """Saves the walls and marks of a board. An empty board is removed instead."""
+        if not walls and not marks:
+            self.remove(fingerprint)
+            return
+        try:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?, ?)",
+                    (_to_signed(fingerprint), _to_signed(walls), _to_signed(marks), puzzle_id, time.time())
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Could not save puzzle progress: {e}")
+
+    def remove(self, fingerprint: int) -> None:
+        """Forgets the progress of a board."""
+        try:
+            with self._db:
+                self._db.execute("DELETE FROM progress WHERE fingerprint = ?", (_to_signed(fingerprint),))
+        except sqlite3.Error as e:
+            logging.error(f"Could not remove puzzle progress: {e}")
+
+    def close(self) -> None:
+        self._db.close()
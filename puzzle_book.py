@@ -0,0 +1,471 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Binary puzzle book format (all values little-endian):
+#
+#    header:    magic "DCPB", u16 version, u16 section count, u32 puzzle count
+#    sections:  one (tag, u32 offset, u32 length) entry per section
+#    "MAPS":    one record per puzzle, three u64 masks (walls, enemies, chests)
+#    "FPRT":    one record per puzzle, u64 fingerprint base, u8 canonical symmetry,
+#               u8 stabilizer (see fingerprint_record)
+#    "FPIX":    u32 puzzle numbers, sorted by fingerprint base
+#    "DIFF":    u16 difficulty score per puzzle (optional, see check_book.py)
+#    "DIDX":    u32 puzzle numbers, sorted by difficulty score (optional)
+#
+#  Masks use the same bit layout as mapcodes.txt: row 0 is the most significant
+#  byte and column x is bit x of its row byte.
+#
+#  A fingerprint identifies the board the player sees, whatever the book it
+#  came from. The upper 61 bits are a digest of the puzzle's canonical form,
+#  the low 3 bits are the symmetry that turns the canonical form into the
+#  board on screen. Books written before the fingerprint sections existed
+#  still load, their fingerprints are worked out when needed.
+#
+#  Difficulty bands split the difficulty index into equal parts, so a random
+#  puzzle of a given band is a single random index into it.
+
+import os
+import gzip
+import json
+import mmap
+import random
+import struct
+import logging
+from collections import OrderedDict, namedtuple
+import bitboard
+from bitboard import Bitboard
+from map_object_enum import MapObject
+
+BOOK_MAGIC = b"DCPB"
+BOOK_VERSION = 1
+SECTION_MAPS = b"MAPS"
+SECTION_FINGERPRINTS = b"FPRT"
+SECTION_FINGERPRINT_INDEX = b"FPIX"
+SECTION_DIFFICULTY = b"DIFF"
+SECTION_DIFFICULTY_INDEX = b"DIDX"
+DIFFICULTY_BANDS = 4
+
+_HEADER = struct.Struct("<4sHHI")
+_SECTION = struct.Struct("<4sII")
+_RECORD = struct.Struct("<QQQ")
+_FINGERPRINT = struct.Struct("<QBB")
+_INDEX = struct.Struct("<I")
+_SCORE = struct.Struct("<H")
+
+# NumPy layout of a "FPRT" record, see fingerprint_records
+_FINGERPRINT_DTYPE = [('base', '<u8'), ('t', 'u1'), ('stabilizer', 'u1')]
+
+# room reserved for the section table by PuzzleBookWriter
+_SECTION_SLOTS = 8
+# puzzles PuzzleBookWriter fingerprints at a time
+_FINGERPRINT_BATCH = 4096
+_SYMMETRY_BITS = 0x7
+
+
+# A decoded puzzle. Each field is a bitboard mask.
+Puzzle = namedtuple("Puzzle", ['walls', 'enemies', 'chests'])
+
+
+def pack_puzzle(grid: list) -> bytes:
+    """Packs an 8x8 puzzle grid into a single book record."""
+    board = Bitboard.from_grid(grid)
+    return _RECORD.pack(board.walls, board.enemies, board.chests)
+
+def pack_puzzles(puzzles: list) -> bytes:
+    """
+    Packs a list of 8x8 puzzle grids into book records, all at once. Same
+    result as pack_puzzle on each grid, without going through Bitboard.
+    """
+
+    import numpy
+    grids = numpy.array(puzzles, dtype=numpy.uint8).reshape(-1, 8, 8)
+    masks = numpy.empty((len(grids), 3), dtype='<u8')
+    for i, obj in enumerate((MapObject.WALL, MapObject.ENEMY, MapObject.CHEST)):
+        rows = numpy.packbits(grids == obj.value, axis=2, bitorder='little').reshape(-1, 8)
+        masks[:, i] = rows.view('>u8').reshape(-1)
+    return masks.tobytes()
+
+def unpack_puzzle(buffer, offset: int = 0) -> Puzzle:
+    """Decodes a single book record at offset."""
+    return Puzzle._make(_RECORD.unpack_from(buffer, offset))
+
+def fingerprint_record(puzzle: Puzzle) -> tuple:
+    """
+    Works out the fingerprint record of a puzzle, as stored in the "FPRT"
+    section: (fingerprint base, canonical symmetry, stabilizer). The base is
+    a 64-bit blake2b digest of the canonical masks with the low 3 bits clear,
+    the canonical symmetry turns the stored puzzle into its canonical form and
+    bit g of the stabilizer is set if symmetry g leaves that form unchanged.
+    """
+
+    import hashlib
+    t, canonical, stabilizer = bitboard.canonical_transform(*puzzle)
+    digest = hashlib.blake2b(_RECORD.pack(*canonical), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') & ~_SYMMETRY_BITS, t, stabilizer
+
+def fingerprint_records(records):
+    """
+    Works out the fingerprint records of many puzzles at once, same as
+    fingerprint_record. records is an (N, 3) NumPy u64 array of book records,
+    returns an (N,) array laid out like the "FPRT" section.
+    """
+
+    import hashlib
+    import numpy
+    count = len(records)
+    keys = numpy.stack([
+        numpy.stack([bitboard.transform_masks(records[:, i], t) for i in range(3)], axis=1)
+        for t in range(8)
+    ])
+
+    # smallest (walls, enemies, chests) key, the lowest symmetry on a tie
+    best = numpy.zeros(count, dtype=numpy.uint8)
+    best_key = keys[0].copy()
+    for t in range(1, 8):
+        key = keys[t]
+        smaller = key[:, 0] < best_key[:, 0]
+        tie = key[:, 0] == best_key[:, 0]
+        smaller |= tie & (key[:, 1] < best_key[:, 1])
+        tie &= key[:, 1] == best_key[:, 1]
+        smaller |= tie & (key[:, 2] < best_key[:, 2])
+        best[smaller] = t
+        best_key[smaller] = key[smaller]
+
+    compose_table = numpy.array([[bitboard.compose(a, b) for b in range(8)] for a in range(8)], dtype=numpy.uint8)
+    undo = numpy.array([bitboard.inverse(t) for t in range(8)], dtype=numpy.uint8)[best]
+    stabilizer = numpy.zeros(count, dtype=numpy.uint8)
+    for u in range(8):
+        same = (keys[u] == best_key).all(axis=1)
+        stabilizer |= same.astype(numpy.uint8) << compose_table[u][undo]
+
+    canonical = memoryview(best_key.astype('<u8').tobytes())
+    size = _RECORD.size
+    blake2b = hashlib.blake2b
+    digests = b"".join([blake2b(canonical[i:i + size], digest_size=8).digest() for i in range(0, len(canonical), size)])
+    out = numpy.empty(count, dtype=_FINGERPRINT_DTYPE)
+    out['base'] = numpy.frombuffer(digests, dtype='<u8') & numpy.uint64(~_SYMMETRY_BITS & bitboard.FULL_MASK)
+    out['t'] = best
+    out['stabilizer'] = stabilizer
+    return out
+
+def make_fingerprint(record: tuple, t: int) -> int:
+    """Returns the fingerprint of a puzzle opened with symmetry t, given its fingerprint record."""
+    base, canonical_t, stabilizer = record
+    shown = bitboard.compose(t, bitboard.inverse(canonical_t))
+
+    # a symmetric board looks the same under several symmetries, use the lowest
+    if stabilizer != 1:
+        shown = min(bitboard.compose(shown, g) for g in range(8) if stabilizer >> g & 1)
+    return base | shown
+
+def is_puzzle_book(file_name: str) -> bool:
+    """Returns True if the file starts with the binary puzzle book magic."""
+    with open(file_name, 'rb') as f:
+        return f.read(len(BOOK_MAGIC)) == BOOK_MAGIC
+
+def write_puzzle_book(file_name: str, puzzles) -> int:
+    """
+    Writes an iterable of 8x8 puzzle grids to a binary puzzle book.
+    Puzzles are packed one at a time, so puzzles can be a generator.
+    Returns the number of puzzles written.
+    """
+
+    with PuzzleBookWriter(file_name) as writer:
+        for grid in puzzles:
+            writer.write(grid)
+    return writer.count
+
+
+class PuzzleBookWriter:
+    """
+    Writes a binary puzzle book incrementally. Puzzles are appended as they
+    are produced and the header is filled in when the writer is closed. The
+    book is written to file_name plus ".tmp" and only moved over file_name
+    once it's complete, if the writer is left by an exception it's deleted.
+    """
+
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+        self._maps_offset = _HEADER.size + _SECTION_SLOTS * _SECTION.size
+        self._file = open(file_name + ".tmp", 'wb')
+        self._file.seek(self._maps_offset)
+        self._pending = bytearray()
+        self._fingerprints = bytearray()
+        self._scores = None
+        self.count = 0
+
+    def __enter__(self) -> "PuzzleBookWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def write(self, grid: list) -> None:
+        """Appends a single 8x8 puzzle grid."""
+        self.write_packed(pack_puzzle(grid))
+
+    def write_puzzle(self, puzzle: Puzzle) -> None:
+        """Appends a single decoded puzzle."""
+        self.write_packed(_RECORD.pack(*puzzle))
+
+    def write_packed(self, records: bytes) -> None:
+        """Appends puzzles that are already packed in the book record layout."""
+        if len(records) % _RECORD.size:
+            raise ValueError("Packed puzzle data is not a whole number of records")
+        self._file.write(records)
+        self._pending += records
+        if len(self._pending) >= _FINGERPRINT_BATCH * _RECORD.size:
+            self._fingerprint_pending()
+        self.count += len(records) // _RECORD.size
+
+    def set_difficulty(self, scores: list) -> None:
+        """
+        Sets the difficulty score of every puzzle, in the order they're written.
+        The difficulty sections are only written if this is called.
+        """
+        self._scores = scores
+
+    def close(self) -> None:
+        """
+        Writes the fingerprint and difficulty sections after the maps, then the
+        header and section table, once the puzzle count is known, closes the
+        file and moves it into place.
+        """
+
+        if self._file.closed:
+            return
+        import numpy
+        self._fingerprint_pending()
+        bases = numpy.frombuffer(self._fingerprints, dtype=_FINGERPRINT_DTYPE)['base']
+        order = numpy.argsort(bases, kind='stable').astype('<u4')
+        sections = [
+            (SECTION_MAPS, self._maps_offset, self.count * _RECORD.size),
+            self._write_section(SECTION_FINGERPRINTS, self._fingerprints),
+            self._write_section(SECTION_FINGERPRINT_INDEX, order.tobytes()),
+        ]
+        if self._scores is not None:
+            if len(self._scores) != self.count:
+                self.discard()
+                raise ValueError(f"Got {len(self._scores)} difficulty scores for {self.count} puzzles")
+            scores = numpy.asarray(self._scores, dtype='<u2')
+            order = numpy.argsort(scores, kind='stable').astype('<u4')
+            sections.append(self._write_section(SECTION_DIFFICULTY, scores.tobytes()))
+            sections.append(self._write_section(SECTION_DIFFICULTY_INDEX, order.tobytes()))
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, len(sections), self.count))
+        for section in sections:
+            self._file.write(_SECTION.pack(*section))
+        self._file.close()
+        os.replace(self._file.name, self._file_name)
+
+    def discard(self) -> None:
+        """Closes the writer without finishing the book and deletes the partial file."""
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._file.name)
+
+    def _fingerprint_pending(self) -> None:
+        """Works out the fingerprint records of the puzzles written since the last call."""
+        import numpy
+        if self._pending:
+            records = numpy.frombuffer(self._pending, dtype='<u8').reshape(-1, 3)
+            self._fingerprints += fingerprint_records(records).tobytes()
+            self._pending = bytearray()
+
+    def _write_section(self, tag: bytes, data: bytes) -> tuple:
+        """Appends a section to the end of the file. Returns its section table entry."""
+        offset = self._file.seek(0, 2)
+        self._file.write(data)
+        return tag, offset, len(data)
+
+
+class PuzzleBook:
+    """
+    Read-only puzzle book. Binary books are memory-mapped, older gzipped JSON 
+    books are packed into the binary record layout when loaded. Either way,
+    puzzles are only decoded when indexed and the most recently opened ones
+    are kept in a small LRU cache.
+    """
+
+    def __init__(self, file_name: str, cache_size: int = 16):
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_size = cache_size
+        self._map = None
+        self._fingerprints_offset = -1
+        self._index_offset = -1
+        self._index = None
+        self._scores_offset = -1
+        self._difficulty_offset = -1
+        if is_puzzle_book(file_name):
+            self._load_binary(file_name)
+        else:
+            self._load_json(file_name)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, num: int) -> Puzzle:
+        if not 0 <= num < self._count:
+            raise IndexError(f"Puzzle {num} out of range")
+        try:
+            self._cache.move_to_end(num)
+            return self._cache[num]
+        except KeyError:
+            pass
+        puzzle = unpack_puzzle(self._buffer, self._maps_offset + num * _RECORD.size)
+        self._cache[num] = puzzle
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return puzzle
+
+    def close(self) -> None:
+        self._cache.clear()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def fingerprint(self, num: int, t: int = 0) -> int:
+        """Returns the fingerprint of puzzle num, opened with symmetry t (see bitboard.transform_index)."""
+        return make_fingerprint(self._fingerprint_record(num), t)
+
+    def find_fingerprint(self, fingerprint: int):
+        """
+        Looks a fingerprint up in the book. Returns (puzzle number, symmetry) of
+        a puzzle that shows the same board, or None if the book doesn't have it.
+        """
+
+        base = fingerprint & ~_SYMMETRY_BITS
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._fingerprint_record(self._index_entry(mid))[0] < base:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self._count:
+            return None
+        num = self._index_entry(lo)
+        record = self._fingerprint_record(num)
+        if record[0] != base:
+            return None
+        return num, bitboard.compose(fingerprint & _SYMMETRY_BITS, record[1])
+
+    def map_records(self) -> bytes:
+        """Returns the packed records of every puzzle, in book order."""
+        return self._buffer[self._maps_offset:self._maps_offset + self._count * _RECORD.size]
+
+    def content_key(self, scores: bool = True) -> int:
+        """
+        Returns a 64-bit digest of the puzzles and their difficulty scores, to
+        tell apart two versions of a book even if they're the same size. With
+        scores unset only the puzzles count, so rating a book keeps its key.
+        """
+
+        import hashlib
+        digest = hashlib.blake2b(self.map_records(), digest_size=8)
+        if scores and self._scores_offset >= 0:
+            digest.update(self._buffer[self._scores_offset:self._scores_offset + self._count * _SCORE.size])
+        return int.from_bytes(digest.digest(), 'little')
+
+    @property
+    def has_difficulty(self) -> bool:
+        """True if the book has a difficulty index."""
+        return self._difficulty_offset >= 0
+
+    def difficulty(self, num: int) -> int:
+        """Returns the difficulty score of puzzle num, -1 if the book has no scores."""
+        if self._scores_offset < 0:
+            return -1
+        return _SCORE.unpack_from(self._buffer, self._scores_offset + num * _SCORE.size)[0]
+
+    def random_puzzle(self, band: int = -1, exclude: int = -1) -> int:
+        """
+        Returns a random puzzle number from a difficulty band, 0 being the easiest
+        of DIFFICULTY_BANDS. Band -1, or a book without a difficulty index, picks
+        from the whole book. Won't return exclude unless it's the only choice.
+        """
+
+        lo, hi = 0, self._count
+        entry = int
+        if band >= 0 and self.has_difficulty and self._count >= DIFFICULTY_BANDS:
+            lo, hi = band * self._count // DIFFICULTY_BANDS, (band + 1) * self._count // DIFFICULTY_BANDS
+            entry = self._difficulty_entry
+        while True:
+            num = entry(random.randrange(lo, hi))
+            if num != exclude or hi - lo <= 1:
+                return num
+
+    def _difficulty_entry(self, i: int) -> int:
+        """Returns the puzzle number in position i of the difficulty index."""
+        return _INDEX.unpack_from(self._buffer, self._difficulty_offset + i * _INDEX.size)[0]
+
+    def _fingerprint_record(self, num: int) -> tuple:
+        """Returns the fingerprint record of puzzle num, working it out if the book doesn't store it."""
+        if self._fingerprints_offset < 0:
+            return fingerprint_record(unpack_puzzle(self._buffer, self._maps_offset + num * _RECORD.size))
+        return _FINGERPRINT.unpack_from(self._buffer, self._fingerprints_offset + num * _FINGERPRINT.size)
+
+    def _index_entry(self, i: int) -> int:
+        """Returns the puzzle number in position i of the fingerprint index."""
+        if self._index_offset >= 0:
+            return _INDEX.unpack_from(self._buffer, self._index_offset + i * _INDEX.size)[0]
+        if self._index is None:
+            logging.info("Puzzle book has no fingerprint index, building one.")
+            bases = [self._fingerprint_record(num)[0] for num in range(self._count)]
+            self._index = sorted(range(self._count), key=lambda num: (bases[num], num))
+        return self._index[i]
+
+    def _load_binary(self, file_name: str) -> None:
+        """Memory-maps a binary puzzle book and locates its map section."""
+        with open(file_name, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = self._map
+        magic, version, sections, self._count = _HEADER.unpack_from(self._map, 0)
+        if magic != BOOK_MAGIC:
+            raise ValueError(f"{file_name} is not a puzzle book")
+        if version > BOOK_VERSION:
+            raise ValueError(f"Unsupported puzzle book version {version} in {file_name}")
+        self._maps_offset = -1
+        for i in range(sections):
+            tag, offset, length = _SECTION.unpack_from(self._map, _HEADER.size + i * _SECTION.size)
+            if tag == SECTION_MAPS and length == self._count * _RECORD.size:
+                self._maps_offset = offset
+            elif tag == SECTION_FINGERPRINTS and length == self._count * _FINGERPRINT.size:
+                self._fingerprints_offset = offset
+            elif tag == SECTION_FINGERPRINT_INDEX and length == self._count * _INDEX.size:
+                self._index_offset = offset
+            elif tag == SECTION_DIFFICULTY and length == self._count * _SCORE.size:
+                self._scores_offset = offset
+            elif tag == SECTION_DIFFICULTY_INDEX and length == self._count * _INDEX.size:
+                self._difficulty_offset = offset
+        if self._maps_offset < 0:
+            raise ValueError(f"Puzzle book {file_name} has no valid map section")
+        logging.debug(f"Mapped puzzle book {file_name}: v{version}, {self._count} puzzles.")
+
+    def _load_json(self, file_name: str) -> None:
+        """Loads a gzipped JSON puzzle book and packs it into book records."""
+        with gzip.open(file_name, 'r') as f:
+            puzzles = json.load(f)
+        self._buffer = pack_puzzles(puzzles)
+        self._count = len(puzzles)
+        self._maps_offset = 0
+        logging.debug(f"Packed JSON puzzle book {file_name}: {self._count} puzzles.")
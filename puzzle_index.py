@@ -0,0 +1,228 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Columnar feature index of a puzzle book, stored next to the book as an
+#  uncompressed .npz file (see index_path). Each column holds one value per
+#  puzzle, in book order, for the puzzle as stored (orientation 0):
+#
+#    walls, enemies, chests    number of each object
+#    chest_x, chest_y          first chest in reading order, -1 if there's none
+#    hint_x, hint_y            (N, 8) column and row hints
+#    symmetry                  number of symmetries that leave the puzzle unchanged
+#    difficulty, band          score and band (0 - 3), if the book has a difficulty index
+#
+#  The index also stores the content key of the book it was built from (see
+#  PuzzleBook.content_key), to tell when it's out of date.
+#
+#  Queries are conditions like "enemies>=4" or "hints<=5". Conditions on a
+#  multi-value column hold if they hold for every value. hints is hint_x and
+#  hint_y together, max_hint and min_hint are the largest and smallest of them.
+
+import os
+import re
+import sys
+import argparse
+import numpy
+from puzzle_book import PuzzleBook, DIFFICULTY_BANDS
+
+VERSION = "v1.1.0"
+
+_CONDITION = re.compile(r"^\s*(\w+)\s*(==|!=|<=|>=|<|>|=)\s*(-?\d+)\s*$")
+_OPERATORS = {
+    "==": numpy.equal, "=": numpy.equal, "!=": numpy.not_equal,
+    "<": numpy.less, "<=": numpy.less_equal, ">": numpy.greater, ">=": numpy.greater_equal,
+}
+
+
+def index_path(book_file: str) -> str:
+    """Returns the file name of a book's feature index."""
+    return book_file + ".npz"
+
+def masks_to_grids(masks: numpy.ndarray) -> numpy.ndarray:
+    """
+    Unpacks an (N,) array of u64 masks into an (N, 8, 8) bool array, indexed
+    [num, y, x]. Same layout as map_convert.unpack_mapcodes.
+    """
+
+    rows = masks.astype('>u8').view(numpy.uint8).reshape(-1, 8)
+    return numpy.unpackbits(rows, axis=1, bitorder='little').reshape(-1, 8, 8).astype(bool)
+
+def count_symmetries(walls: numpy.ndarray, enemies: numpy.ndarray, chests: numpy.ndarray) -> numpy.ndarray:
+    """Counts the symmetries that leave each (N, 8, 8) puzzle unchanged, 1 for most of them."""
+    count = numpy.zeros(len(walls), dtype=numpy.uint8)
+    for flip in (False, True):
+        for rot in range(4):
+            same = numpy.ones(len(walls), dtype=bool)
+            for grid in (walls, enemies, chests):
+                moved = numpy.rot90(grid, rot, axes=(1, 2))
+                if flip:
+                    moved = numpy.flip(moved, axis=2)
+                same &= (moved == grid).all(axis=(1, 2))
+            count += same
+    return count
+
+def build_index(records: numpy.ndarray, scores: numpy.ndarray = None) -> dict:
+    """
+    Builds the index columns from an (N, 3) array of book records (walls,
+    enemies, chests masks). If scores are given the difficulty columns are
+    added, bands are worked out the same way as PuzzleBook.random_puzzle.
+    """
+
+    walls, enemies, chests = (masks_to_grids(records[:, i]) for i in range(3))
+    count = len(records)
+    first_chest = chests.reshape(count, 64).argmax(axis=1)
+    has_chest = chests.any(axis=(1, 2))
+    columns = {
+        "walls": walls.sum(axis=(1, 2), dtype=numpy.uint8),
+        "enemies": enemies.sum(axis=(1, 2), dtype=numpy.uint8),
+        "chests": chests.sum(axis=(1, 2), dtype=numpy.uint8),
+        "chest_x": numpy.where(has_chest, first_chest % 8, -1).astype(numpy.int8),
+        "chest_y": numpy.where(has_chest, first_chest // 8, -1).astype(numpy.int8),
+        "hint_x": walls.sum(axis=1, dtype=numpy.uint8),
+        "hint_y": walls.sum(axis=2, dtype=numpy.uint8),
+        "symmetry": count_symmetries(walls, enemies, chests),
+    }
+    if scores is not None:
+        order = numpy.lexsort((numpy.arange(count), scores))
+        starts = [b * count // DIFFICULTY_BANDS for b in range(1, DIFFICULTY_BANDS)]
+        band = numpy.empty(count, dtype=numpy.uint8)
+        band[order] = numpy.searchsorted(starts, numpy.arange(count), side='right')
+        columns["difficulty"] = scores.astype(numpy.uint16)
+        columns["band"] = band
+    return columns
+
+def build_book_index(book_file: str) -> dict:
+    """Builds the index columns of a puzzle book, plus the book's content key."""
+    book = PuzzleBook(book_file, cache_size=0)
+    records = numpy.frombuffer(book.map_records(), dtype='<u8').reshape(-1, 3)
+    scores = None
+    if book.has_difficulty:
+        scores = numpy.array([book.difficulty(num) for num in range(len(book))], dtype=numpy.uint16)
+    columns = build_index(records, scores)
+    columns["book_key"] = numpy.array(book.content_key(), dtype=numpy.uint64)
+    book.close()
+    return columns
+
+def write_index(file_name: str, columns: dict) -> None:
+    """Writes index columns to an uncompressed .npz file."""
+    with open(file_name, 'wb') as f:
+        numpy.savez(f, **columns)
+
+
+class PuzzleIndex:
+    """Columnar feature index of a puzzle book. See the top of this file for the columns."""
+
+    def __init__(self, columns: dict):
+        self.book_key = int(columns.pop("book_key", -1))
+        self._columns = columns
+        self._count = len(columns["walls"])
+
+    def __len__(self) -> int:
+        return self._count
+
+    @classmethod
+    def load(cls, file_name: str) -> "PuzzleIndex":
+        with numpy.load(file_name) as data:
+            return cls({name: data[name] for name in data.files})
+
+    @classmethod
+    def for_book(cls, book_file: str) -> "PuzzleIndex":
+        """
+        Loads a book's index, building and writing it first if it's missing
+        or was built from another version of the book.
+        """
+
+        file_name = index_path(book_file)
+        if os.path.exists(file_name):
+            index = cls.load(file_name)
+            book = PuzzleBook(book_file, cache_size=0)
+            key = book.content_key()
+            book.close()
+            if index.book_key == key:
+                return index
+        columns = build_book_index(book_file)
+        try:
+            write_index(file_name, columns)
+        except OSError:
+            pass    # read-only install, the index is rebuilt next time
+        return cls(columns)
+
+    @property
+    def columns(self) -> list:
+        return sorted(self._columns) + ["hints", "max_hint", "min_hint"]
+
+    def column(self, name: str) -> numpy.ndarray:
+        """Returns a column by name, including the derived hint columns."""
+        if name in self._columns:
+            return self._columns[name]
+        if name == "hints":
+            return numpy.concatenate((self._columns["hint_x"], self._columns["hint_y"]), axis=1)
+        if name == "max_hint":
+            return self.column("hints").max(axis=1)
+        if name == "min_hint":
+            return self.column("hints").min(axis=1)
+        raise KeyError(f"Unknown index column '{name}'")
+
+    def mask(self, *conditions: str) -> numpy.ndarray:
+        """Returns a bool array of the puzzles that meet every condition."""
+        keep = numpy.ones(self._count, dtype=bool)
+        for condition in conditions:
+            match = _CONDITION.match(condition)
+            if match is None:
+                raise ValueError(f"Invalid condition '{condition}'")
+            name, op, value = match.groups()
+            result = _OPERATORS[op](self.column(name), int(value))
+            if result.ndim > 1:
+                result = result.all(axis=1)
+            keep &= result
+        return keep
+
+    def query(self, *conditions: str) -> numpy.ndarray:
+        """Returns the numbers of the puzzles that meet every condition."""
+        return numpy.flatnonzero(self.mask(*conditions))
+
+
+def main():
+    print(f"Puzzle Index {VERSION}")
+
+    parser = argparse.ArgumentParser(description="Finds puzzles by their features, e.g. 'chests>=1' 'enemies>=4' 'hints<=5'.")
+    parser.add_argument("-b", "--book", default="puzzles.bin", help="Puzzle book. Its index is built if it's missing or out of date.")
+    parser.add_argument("--build", action="store_true", help="Rebuild the index even if it looks up to date.")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="Number of puzzle IDs to list, 0 for all.")
+    parser.add_argument("conditions", nargs='*')
+    args = parser.parse_args()
+
+    if args.build:
+        write_index(index_path(args.book), build_book_index(args.book))
+        print(f"Wrote {index_path(args.book)}.")
+    index = PuzzleIndex.for_book(args.book)
+    try:
+        nums = index.query(*args.conditions)
+    except (KeyError, ValueError) as e:
+        print(e.args[0])
+        print(f"Columns: {', '.join(index.columns)}")
+        return 1
+    print(f"{len(nums)} of {len(index)} puzzles match.")
+    shown = nums if args.limit <= 0 else nums[:args.limit]
+    if len(shown):
+        print(" ".join(f"{num:07d}" for num in shown) + (" ..." if len(shown) < len(nums) else ""))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,6 +22,29 @@ import sys
 import json
 import logging
 
+def get_save_path(file_name: str) -> str:
+    """
+    Returns where a file the game writes, such as the save file, is kept. When
+    compiled, it needs to go in the user's config directory instead.
+    """
+
+    file_path = ''
+    if hasattr(sys, "_MEIPASS"):
+        plat = sys.platform
+        file_dir: str = ''
+        if plat == 'darwin':
+            file_dir = os.path.expanduser('~/Library/Application Support/')
+        elif plat == 'win32':
+            file_dir = os.path.expanduser('~/APPDATA/LOCAL/')
+        elif plat == 'linux':
+            file_dir = os.path.expanduser('~/.config/')
+        else:
+            raise OSError(f"Unsupported platform: {sys.platform}")
+        file_path = os.path.join(file_dir, file_name)
+    else:
+        file_path = os.path.join('.', file_name)
+    return file_path
+
 class SaveFile:
     def __init__(self, save_file_name: str):
         self._save_path: str = self._get_save_path(save_file_name)
@@ -46,19 +69,4 @@ class SaveFile:
 
     def _get_save_path(self, file_name: str) -> str:
         """When compiled, MacOS needs to store the save file to a different location"""
-        file_path = ''
-        if hasattr(sys, "_MEIPASS"):
-            plat = sys.platform
-            file_dir: str = ''
-            if plat == 'darwin':
-                file_dir = os.path.expanduser('~/Library/Application Support/')
-            elif plat == 'win32':
-                file_dir = os.path.expanduser('~/APPDATA/LOCAL/')
-            elif plat == 'linux':
-                file_dir = os.path.expanduser('~/.config/')
-            else:
-                raise OSError(f"Unsupported platform: {sys.platform}")
-            file_path = os.path.join(file_dir, file_name)
-        else:
-            file_path = os.path.join('.', file_name)
-        return file_path
\ No newline at end of file
+        return get_save_path(file_name)
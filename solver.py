@@ -0,0 +1,316 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Puzzle rules, as used by the puzzle generator in map_convert.py:
+#    1. Each row and column has as many walls as its hint.
+#    2. An open cell is a dead-end (walls or board edge on three sides) if, and
+#       only if, it holds an enemy.
+#    3. Every chest sits in an open 3x3 treasure room.
+#    4. There are no open 2x2 areas outside of treasure rooms.
+#    5. All open cells are connected.
+#
+#  The solver works a row at a time. Each row is an 8-bit wall mask (bit x is
+#  column x, same as bitboard.py) picked from the masks with the right number of
+#  walls. Column counts are kept as 5-bit fields packed into a single int so the
+#  column limits of a partial board can be checked with a couple of additions,
+#  and the last row is read straight off the missing column counts. Placing a
+#  row also fixes which cells of the next row must be walls or open for the
+#  dead-end rule to hold. Open 2x2 areas are checked as soon as every room that
+#  could contain them is known, and the remaining rules once the board is complete.
+
+from bitboard import FULL_MASK, column_count, row_count
+
+_FIELD = 5
+_GUARD = sum(1 << (i * _FIELD + 4) for i in range(8))
+_ONES = sum(1 << (i * _FIELD) for i in range(8))
+_NOT_COL0 = FULL_MASK ^ 0x0101010101010101
+_NOT_COL7 = FULL_MASK ^ 0x8080808080808080
+
+def _build_subsets() -> tuple:
+    """_SUBSETS[free][n] lists the row masks with n walls, all of them on cells in free."""
+    subsets = []
+    for free in range(256):
+        by_count = [[] for _ in range(9)]
+        r = free
+        while True:
+            by_count[bin(r).count('1')].append(r)
+            if r == 0:
+                break
+            r = (r - 1) & free
+        subsets.append(tuple(tuple(c) for c in by_count))
+    return tuple(subsets)
+
+_SUBSETS = _build_subsets()
+
+# row mask -> column counts packed into 5-bit fields, and back
+_SPREAD = tuple(sum(((r >> x) & 1) << (x * _FIELD) for x in range(8)) for r in range(256))
+_UNSPREAD = {v: r for r, v in enumerate(_SPREAD)}
+
+# guard bits of the packed fields -> row mask of the matching columns
+_GUARD_TO_ROW = {_SPREAD[r] << 4: r for r in range(256)}
+
+
+def _pack_counts(counts: list) -> int:
+    return sum(v << (i * _FIELD) for i, v in enumerate(counts))
+
+def _zero_fields(packed: int) -> int:
+    """Returns a row mask of the columns whose packed field is zero."""
+    return _GUARD_TO_ROW[~((packed | _GUARD) - _ONES) & _GUARD]
+
+def _to_rows(mask: int) -> list:
+    return [(mask >> ((7 - y) * 8)) & 0xFF for y in range(8)]
+
+def _to_mask(rows: list) -> int:
+    mask = 0
+    for row in rows:
+        mask = (mask << 8) | row
+    return mask
+
+def _dead_ends(above: int, row: int, below: int) -> tuple:
+    """
+    Returns masks of the open cells in row that have walls on exactly three
+    sides, and on all four sides. Rows past the board edge are passed as 0xFF.
+    """
+
+    left = ((row << 1) | 0x01) & 0xFF
+    right = (row >> 1) | 0x80
+    both = left & right
+    three = (above & below & (left ^ right)) | ((above ^ below) & both)
+    four = above & below & both
+    open_cells = ~row & 0xFF
+    return open_cells & three, open_cells & four
+
+def _rooms(rows: list, chests: list, first: int, last: int) -> list:
+    """
+    Returns, for each row, the cells that are part of an open 3x3 room holding
+    a chest. Only rooms with a top row between first and last are considered.
+    """
+
+    cover = [0] * 8
+    for y in range(max(first, 0), min(last, 5) + 1):
+        if not (chests[y] | chests[y + 1] | chests[y + 2]):
+            continue
+        open3 = ~(rows[y] | rows[y + 1] | rows[y + 2]) & 0xFF
+        starts = open3 & (open3 >> 1) & (open3 >> 2) & 0x3F
+        while starts:
+            low = starts & -starts
+            starts ^= low
+            room = low * 0x07
+            if room & (chests[y] | chests[y + 1] | chests[y + 2]):
+                cover[y] |= room
+                cover[y + 1] |= room
+                cover[y + 2] |= room
+    return cover
+
+def _open_squares(rows: list, y: int) -> int:
+    """Returns the cells of rows y and y + 1 that are part of an open 2x2 area."""
+    open2 = ~(rows[y] | rows[y + 1]) & 0xFF
+    starts = open2 & (open2 >> 1) & 0x7F
+    return starts | (starts << 1)
+
+def _squares_in_rooms(rows: list, chests: list, y: int) -> bool:
+    """Checks that every open 2x2 area in rows y and y + 1 lies inside treasure rooms."""
+    squares = _open_squares(rows, y)
+    if not squares:
+        return True
+    cover = _rooms(rows, chests, y - 2, y + 1)
+    return squares & ~cover[y] == 0 and squares & ~cover[y + 1] == 0
+
+def _reach(seed: int, open_mask: int) -> int:
+    """Flood fills open_mask from the cells in seed, returns every cell reached."""
+    reach = seed
+    while True:
+        grow = reach | (reach << 8) | (reach >> 8) | ((reach << 1) & _NOT_COL0) | ((reach >> 1) & _NOT_COL7)
+        grow &= open_mask
+        if grow == reach:
+            return reach
+        reach = grow
+
+def _connected(open_mask: int) -> bool:
+    """Checks that all open cells of a full board mask are orthogonally connected."""
+    return _reach(open_mask & -open_mask, open_mask) == open_mask
+
+def _finish_checks(rows: list, enemies: list, chests: list) -> bool:
+    """Runs the checks that need the complete board."""
+
+    # the bottom row's dead-ends
+    dead, closed = _dead_ends(rows[6], rows[7], 0xFF)
+    if dead != enemies[7] or closed:
+        return False
+
+    # open 2x2 areas not yet checked, then every chest needs a room
+    if not _squares_in_rooms(rows, chests, 5) or not _squares_in_rooms(rows, chests, 6):
+        return False
+    cover = _rooms(rows, chests, 0, 5)
+    for y in range(8):
+        if chests[y] & ~cover[y]:
+            return False
+    return _connected(FULL_MASK ^ _to_mask(rows))
+
+
+def hints_from_walls(walls: int) -> tuple:
+    """Returns the (hint_x, hint_y) lists for a wall mask, same as DungeonCross._calc_hints."""
+    return [column_count(walls, x) for x in range(8)], [row_count(walls, y) for y in range(8)]
+
+def solve(hint_x: list, hint_y: list, enemies: int, chests: int, limit: int = 1, stats: dict = None) -> list:
+    """
+    Finds wall masks that satisfy the hints and the puzzle rules. Stops after
+    limit solutions have been found, returns the list of solutions. If stats
+    is given, the search effort is stored in it: "nodes" is the number of
+    partial boards visited and "branches" the number of those that had more
+    than one way to continue, which is roughly how often a player has to guess.
+    """
+
+    enemy_rows = _to_rows(enemies)
+    chest_rows = _to_rows(chests)
+    fixed_rows = [e | c for e, c in zip(enemy_rows, chest_rows)]
+    target = _pack_counts(hint_x)
+    limit_guard = target | _GUARD
+
+    # free cells per column in the rows below each row, used to prune columns
+    # that can no longer reach their hint
+    capacity = [0] * 8
+    for y in range(6, -1, -1):
+        capacity[y] = capacity[y + 1] + _SPREAD[~fixed_rows[y + 1] & 0xFF]
+
+    # cells close enough to a chest to be part of a treasure room
+    near_chest = [0] * 8
+    for y in range(8):
+        if chest_rows[y]:
+            wide = chest_rows[y]
+            for _ in range(2):
+                wide |= ((wide << 1) | (wide >> 1)) & 0xFF
+            for ny in range(max(y - 2, 0), min(y + 3, 8)):
+                near_chest[ny] |= wide
+
+    solutions = []
+    rows = [0] * 8
+    effort = [0, 0]
+
+    def place(y: int, counts: int, must_wall: int, must_open: int) -> bool:
+        effort[0] += 1
+        children = 0
+        above = rows[y - 1] if y >= 1 else 0xFF
+        enemies_y = enemy_rows[y]
+        missing = target - counts
+        if y == 7:
+            last = _UNSPREAD.get(missing)
+            if last is None or last & fixed_rows[7]:
+                return False
+            row_candidates = (last,)
+        else:
+
+            # full columns must stay open, columns that need every free cell left must be walls
+            must_open |= _zero_fields(missing)
+            must_wall |= _zero_fields(capacity[y] + _SPREAD[~fixed_rows[y] & 0xFF] - missing) & ~fixed_rows[y]
+            if must_wall & must_open:
+                return False
+            walls_needed = hint_y[y] - bin(must_wall).count('1')
+            if walls_needed < 0:
+                return False
+            free = ~(must_wall | must_open | fixed_rows[y]) & 0xFF
+            row_candidates = [must_wall | r for r in _SUBSETS[free][walls_needed]]
+        for row in row_candidates:
+
+            # forced by the dead-end rule in the row above
+            if row & must_open or must_wall & ~row:
+                continue
+
+            # no column may exceed its hint or be unable to reach it
+            new_counts = counts + _SPREAD[row]
+            if (limit_guard - new_counts) & _GUARD != _GUARD:
+                continue
+            if ((new_counts + capacity[y] + _GUARD) - target) & _GUARD != _GUARD:
+                continue
+
+            # with three sides of each open cell known (above, left, right), work out
+            # what the row below must be: an enemy needs exactly three walls, any
+            # other open cell can't have three or four
+            left = ((row << 1) | 0x01) & 0xFF
+            right = (row >> 1) | 0x80
+            known3 = above & left & right
+            known2 = (above & (left ^ right)) | (~above & left & right)
+            others = ~(row | enemies_y) & 0xFF
+            if enemies_y & ~(known2 | known3) or others & known3:
+                continue
+            next_wall = enemies_y & known2
+            next_open = (enemies_y & known3) | (others & known2)
+            if y < 7:
+
+                # the forced cells of the next row must fit the columns as well
+                if next_wall & fixed_rows[y + 1]:
+                    continue
+                if (limit_guard - new_counts - _SPREAD[next_wall]) & _GUARD != _GUARD:
+                    continue
+                spare = capacity[y] - _SPREAD[next_open & ~fixed_rows[y + 1]]
+                if ((new_counts + spare + _GUARD) - target) & _GUARD != _GUARD:
+                    continue
+            rows[y] = row
+
+            # an open 2x2 can only be inside a room, so it must at least be near a chest
+            if y >= 1:
+                squares = _open_squares(rows, y - 1)
+                if squares & ~near_chest[y - 1] or squares & ~near_chest[y]:
+                    continue
+
+            # every room that could hold an open 2x2 in rows y - 3, y - 2 is known now
+            if y >= 3 and not _squares_in_rooms(rows, chest_rows, y - 3):
+                continue
+            children += 1
+            if children == 2:
+                effort[1] += 1
+            if y == 7:
+                if new_counts == target and _finish_checks(rows, enemy_rows, chest_rows):
+                    solutions.append(_to_mask(rows))
+                    if len(solutions) >= limit:
+                        return True
+            elif place(y + 1, new_counts, next_wall, next_open):
+                return True
+        return False
+
+    place(0, 0, 0, 0)
+    if stats is not None:
+        stats["nodes"], stats["branches"] = effort
+    return solutions
+
+def count_solutions(hint_x: list, hint_y: list, enemies: int, chests: int, limit: int = 2, stats: dict = None) -> int:
+    """Counts the solutions of a puzzle, stopping at limit. See solve() for stats."""
+    return len(solve(hint_x, hint_y, enemies, chests, limit, stats))
+
+def solve_puzzle(walls: int, enemies: int, chests: int, limit: int = 1) -> list:
+    """Convenience wrapper for solve() using the hints of a known wall layout."""
+    hint_x, hint_y = hints_from_walls(walls)
+    return solve(hint_x, hint_y, enemies, chests, limit)
+
+def check_walls(walls: int, enemies: int, chests: int) -> bool:
+    """Checks a complete wall layout against the puzzle rules, ignoring hints."""
+    rows = _to_rows(walls)
+    enemy_rows = _to_rows(enemies)
+    chest_rows = _to_rows(chests)
+    if any(rows[y] & (enemy_rows[y] | chest_rows[y]) for y in range(8)):
+        return False
+    for y in range(7):
+        above = rows[y - 1] if y >= 1 else 0xFF
+        dead, closed = _dead_ends(above, rows[y], rows[y + 1])
+        if dead != enemy_rows[y] or closed:
+            return False
+    for y in range(5):
+        if not _squares_in_rooms(rows, chest_rows, y):
+            return False
+    return _finish_checks(rows, enemy_rows, chest_rows)
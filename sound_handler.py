@@ -86,13 +86,15 @@ class SoundHandler:
         if self._mixer_running:
             mixer.music.stop()
 
-    def load_sfx(self, sound_effect_path: str, volume: float = 0.6) -> mixer.Sound:
+    def load_sfx(self, sound_effect_path: str, volume: float = 0.6, force: bool = False) -> mixer.Sound:
         """
         If the SoundHandler is enabled and the mixer is running, load
-        all the sound effect files in the given path.
+        all the sound effect files in the given path. With force set the
+        effect is loaded even while sound is disabled, so it's there once
+        sound is turned back on.
         """
 
-        if self.enabled and self._mixer_running:        
+        if (self.enabled or force) and self._mixer_running:
             try:
                 snd = mixer.Sound(resource_path(sound_effect_path))
                 snd.set_volume(0.6)
@@ -104,10 +106,11 @@ class SoundHandler:
     def play_sfx(self, sound_effect: mixer.Sound) -> None:
         """
         Play a sound effect file (of type mixer.Sound).
-        Wraps sfx calls in a try/except block.
+        Wraps sfx calls in a try/except block. Effects that haven't been
+        loaded (None) are skipped.
         """
 
-        if self.enabled and self._mixer_running:
+        if self.enabled and self._mixer_running and sound_effect is not None:
             try:
                 sound_effect.play()
             except pygame_error as e:
@@ -0,0 +1,138 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+import logging
+import pygame
+from resource_path import resource_path
+
+def decode_sprites(paths: list) -> dict:
+    """
+    Decodes sprite PNGs without converting them, returns {path: surface}. Doesn't
+    touch the display, so it can run on a loader thread while the window is up.
+    """
+
+    decoded = {}
+    for path in paths:
+        if path not in decoded:
+            logging.debug(f"Loading sprite: {path}")
+            try:
+                decoded[path] = pygame.image.load(resource_path(path))
+            except FileNotFoundError:
+                logging.critical(f"Could not open sprite: {path}")
+                raise
+    return decoded
+
+
+class SpriteAtlas:
+    """
+    Loads sprites into display-format atlas surfaces. Opaque sprites share one
+    atlas converted with convert(), sprites with transparency share another
+    converted with convert_alpha(), and each sprite is handed out as a
+    subsurface of its atlas. Scaled sprites are cached by (path, size), so a
+    PNG is only decoded and scaled once for each size it's used at.
+    The display mode must be set before creating an atlas.
+    """
+
+    def __init__(self, sprites: list, width: int = 1024, decoded: dict = None):
+        """
+        sprites is a list of (path, (size_x, size_y)) pairs to pack into the atlas.
+        decoded optionally holds images already loaded by decode_sprites.
+        """
+
+        self._sprites: dict = {}
+        self._atlases: list = []
+        self._decoded: dict = dict(decoded or {})
+        opaque = []
+        alpha = []
+        for path, size in sprites:
+            key = (path, tuple(size))
+            if key in self._sprites:
+                continue
+            image = self._load_scaled(*key)
+            (alpha if self._has_alpha(image) else opaque).append((key, image))
+            self._sprites[key] = image
+        for items, use_alpha in ((opaque, False), (alpha, True)):
+            if items:
+                self._pack(items, use_alpha, width)
+        self._decoded.clear()
+
+    def get(self, path: str, size: tuple) -> pygame.Surface:
+        """
+        Returns the sprite at path scaled to size. Sprites that weren't packed
+        into the atlas are loaded, converted and cached on first use.
+        """
+
+        key = (path, tuple(size))
+        try:
+            return self._sprites[key]
+        except KeyError:
+            pass
+        image = self._load_scaled(*key)
+        image = image.convert_alpha() if self._has_alpha(image) else image.convert()
+        self._sprites[key] = image
+        return image
+
+    def _load_scaled(self, path: str, size: tuple) -> pygame.Surface:
+        """Decodes a PNG, reusing earlier decodes of the same file, and scales it to size."""
+        try:
+            image = self._decoded[path]
+        except KeyError:
+            image = decode_sprites([path])[path]
+            self._decoded[path] = image
+        if image.get_size() != size:
+            image = pygame.transform.scale(image, size)
+        return image
+
+    def _pack(self, items: list, use_alpha: bool, width: int) -> None:
+        """
+        Packs scaled sprites into a new atlas using rows ("shelves") of sprites
+        sorted by height, then points each sprite at its area of the atlas.
+        """
+
+        items.sort(key=lambda item: item[1].get_height(), reverse=True)
+        width = max(width, max(image.get_width() for _, image in items))
+        places = []
+        x = y = shelf = 0
+        for key, image in items:
+            w, h = image.get_size()
+            if x + w > width:
+                x, y, shelf = 0, y + shelf, 0
+            places.append((key, image, pygame.Rect(x, y, w, h)))
+            x += w
+            shelf = max(shelf, h)
+
+        if use_alpha:
+            atlas = pygame.Surface((width, y + shelf), pygame.SRCALPHA).convert_alpha()
+            atlas.fill((0, 0, 0, 0))
+        else:
+            atlas = pygame.Surface((width, y + shelf)).convert()
+        for key, image, rect in places:
+            if use_alpha:
+                # copy pixels and alpha as-is instead of blending onto the empty atlas
+                atlas.blit(image.convert_alpha(), rect, special_flags=pygame.BLEND_RGBA_MAX)
+            else:
+                atlas.blit(image, rect)
+        for key, image, rect in places:
+            self._sprites[key] = atlas.subsurface(rect)
+        self._atlases.append(atlas)
+        logging.debug(f"Packed {len(places)} sprites into a {width}x{y + shelf} atlas (alpha: {use_alpha}).")
+
+    @staticmethod
+    def _has_alpha(image: pygame.Surface) -> bool:
+        return bool(image.get_flags() & pygame.SRCALPHA) or image.get_colorkey() is not None
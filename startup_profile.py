@@ -0,0 +1,87 @@
+#       Dungeon Cross
+#  Written by HalfBurntToast
+#  https://github.com/halfburnttoast/Dungeon-Cross
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#  
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+
+#  Startup profiler, used by dungeon_cross.py --profile-startup. install()
+#  wraps the import statement to time every module imported for the first
+#  time, and mark() splits startup into named phases. report() returns both
+#  as text. Nothing is timed unless install() was called.
+
+import sys
+import builtins
+from time import perf_counter_ns
+
+_original_import = builtins.__import__
+_installed = False
+_start = 0
+_last_mark = 0
+_phases: list = []       # (phase name, ns)
+_imports: list = []      # (module name, nesting depth, cumulative ns, self ns)
+_child_time: list = []   # time spent in nested imports, one entry per open import
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = len(_child_time)
+    _child_time.append(0)
+    start = perf_counter_ns()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = perf_counter_ns() - start
+        children = _child_time.pop()
+        if _child_time:
+            _child_time[-1] += elapsed
+        _imports.append((name, depth, elapsed, elapsed - children))
+
+def install() -> None:
+    """Starts timing imports and phases. Call as early as possible."""
+    global _installed, _start, _last_mark
+    if _installed:
+        return
+    _installed = True
+    _start = _last_mark = perf_counter_ns()
+    builtins.__import__ = _timed_import
+
+def uninstall() -> None:
+    """Stops timing imports. Collected timings are kept."""
+    builtins.__import__ = _original_import
+
+def enabled() -> bool:
+    return _installed
+
+def mark(phase: str) -> None:
+    """Ends a startup phase: records the time since the previous mark (or install) as phase."""
+    global _last_mark
+    if not _installed:
+        return
+    now = perf_counter_ns()
+    _phases.append((phase, now - _last_mark))
+    _last_mark = now
+
+def report(top: int = 25) -> list:
+    """Returns the phase timings and the slowest top-level imports as lines of text."""
+    lines = ["Startup phases (ms):"]
+    for phase, ns in _phases:
+        lines.append(f"  {phase:<28} {ns / 1e6:9.2f}")
+    lines.append(f"  {'total':<28} {(_last_mark - _start) / 1e6:9.2f}")
+    lines.append(f"Slowest imports (ms, cumulative / self, nesting depth):")
+    for name, depth, cumulative, own in sorted(_imports, key=lambda i: i[2], reverse=True)[:top]:
+        lines.append(f"  {name:<40} {cumulative / 1e6:9.2f} {own / 1e6:9.2f}  {depth}")
+    return lines